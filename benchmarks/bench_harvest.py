@@ -0,0 +1,70 @@
+"""
+rows/sec of data_harvester.harvest against local stand-in ES, APN and ESFiller servers
+python3 -m benchmarks.bench_harvest -n 200 -c 1 4 16 --latency 0.02 [--mget-window 100] [--named-queries]
+"""
+import time
+import random
+import argparse
+from collections import namedtuple
+from functools import partial
+import data_harvester
+from benchmarks.standins import StandInES, StandInAPN, StandInESFiller
+from benchmarks.synthetic import make_apn_doc, make_hit
+from lib.connectors import APN, ESFiller
+from lib.doc_resolver import DocResolver
+from libsearcher.pylibshared.utils.elastic import ESClient
+
+Row = namedtuple('Row', ('talent_id', 'job_id', 'job_duty', 'talent_duty'))
+
+
+def make_rows(n, n_jobs, n_talents, seed=0):
+    rnd = random.Random(seed)
+    return [Row(rnd.randrange(n_talents), rnd.randrange(n_jobs), 'Amos', 'Amos') for _ in range(n)]
+
+
+def prefill(es, rows, hit_rate, size='small', seed=0):
+    rnd = random.Random(seed)
+    for row in rows:
+        es.docs.setdefault(f'jobs_{data_harvester.TENANT_ID}', {})[str(row.job_id)] = \
+            make_hit('job', row.job_id, size, tenant_id=data_harvester.TENANT_ID)['_source']
+        if rnd.random() < hit_rate:
+            es.docs.setdefault(f'talents_{data_harvester.TENANT_ID}', {})[str(row.talent_id)] = \
+                make_hit('talent', row.talent_id, size, tenant_id=data_harvester.TENANT_ID)['_source']
+
+
+def run(rows, max_in_flight, latency, hit_rate, mget_window=0, named_queries=False, size='small'):
+    apn_doc = partial(make_apn_doc, size=size)
+    with StandInES(latency=latency) as es, StandInAPN(apn_doc, latency=latency) as apn_server, \
+            StandInESFiller(es, latency=latency) as filler_server:
+        prefill(es, rows, hit_rate, size)
+        data_harvester.TARGET_ES = ESClient(es.address)
+        apn = APN(host='http://' + apn_server.address, refresh_token='stand-in')
+        es_filler = ESFiller(server=filler_server.address)
+        start = time.perf_counter()
+        resolver = None
+        if mget_window > 0:
+            resolver = DocResolver(data_harvester.TARGET_ES, apn, es_filler, data_harvester.TENANT_ID)
+            rows = resolver.read_ahead(rows, window=mget_window)
+        n = sum(1 for _ in data_harvester.harvest(rows, apn, es_filler, max_in_flight=max_in_flight,
+                                                  resolver=resolver, named_queries=named_queries))
+        elapsed = time.perf_counter() - start
+        return n / elapsed, es.requests + apn_server.requests + filler_server.requests
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the harvest loop against local stand-in servers.')
+    parser.add_argument("-n", "--rows", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument("--jobs", type=int, default=20, help='number of distinct jobs;')
+    parser.add_argument("--talents", type=int, default=1000, help='number of distinct talents;')
+    parser.add_argument("--latency", type=float, default=0.02, help='seconds added to every stand-in request;')
+    parser.add_argument("--hit-rate", type=float, default=0.9, help='ratio of talents already in ES;')
+    parser.add_argument("--mget-window", type=int, default=0, help='resolve the docs by mget windows, 0 to disable;')
+    parser.add_argument("--named-queries", action='store_true', help='diagnose with one search per row;')
+    parser.add_argument("--size", choices=('small', 'medium', 'large'), default='small', help='size of the docs;')
+    args = parser.parse_args()
+    rows_ = make_rows(args.rows, args.jobs, args.talents)
+    for c_ in args.concurrency:
+        rate, requests_ = run(rows_, c_, args.latency, args.hit_rate, args.mget_window, args.named_queries,
+                              args.size)
+        print(f"concurrency={c_:<4d} rows={len(rows_)} {rate:10.2f} rows/sec  {requests_} requests")
@@ -0,0 +1,40 @@
+"""
+import time of the harvester modules in fresh interpreters, with the slowest imports from -X importtime
+python3 -m benchmarks.bench_import -r 5 data_harvester lib.connectors
+"""
+import sys
+import time
+import argparse
+import subprocess
+
+
+def import_time(module):
+    """
+    :return: (wall seconds of `python -c "import module"`, [(cumulative us, imported module), ...])
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    imports = []
+    for line in completed.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            imports.append((int(cumulative), name.strip()))
+    return elapsed, imports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the harvester modules.')
+    parser.add_argument("modules", nargs='*', default=['data_harvester', 'lib.connectors', 'lib.datatype.job'])
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-t", "--top", type=int, default=10, help='number of slowest imports shown;')
+    args = parser.parse_args()
+    baseline, _ = min(import_time('sys') for _ in range(args.repeat))
+    print(f"{'interpreter startup':<30s} {baseline * 1000:8.1f} ms")
+    for module_ in args.modules:
+        runs = [import_time(module_) for _ in range(args.repeat)]
+        elapsed, imports = min(runs, key=lambda r_: r_[0])
+        print(f"{module_:<30s} {elapsed * 1000:8.1f} ms (+{(elapsed - baseline) * 1000:.1f} ms over startup)")
+        for cumulative, name in sorted(imports, reverse=True)[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
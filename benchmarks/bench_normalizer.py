@@ -0,0 +1,53 @@
+"""
+micro-benchmark of the APN payload normalization on large talent documents:
+the former recursive formatter followed by talent_v1_to_v2, against the fused PayloadNormalizer
+python3 -m benchmarks.bench_normalizer -n 200 --experiences 60 --skills 300
+"""
+import json
+import time
+import argparse
+from environments import TALENT_USELESS_KEYS
+from lib.payload_normalizer import TALENT_V2_NORMALIZER
+from lib.talent_formatter import talent_v1_to_v2
+from benchmarks.synthetic import make_talent
+
+
+def format_talent_data(data):
+    """
+    the recursive formatter APN used before PayloadNormalizer, kept as the reference
+    """
+    if isinstance(data, dict):
+        data = dict((k, v_) for k, v in data.items() if k not in TALENT_USELESS_KEYS
+                    and (v_ := format_talent_data(v)) is not None)
+    elif isinstance(data, list):
+        data = list(v_ for v in data if (v_ := format_talent_data(v)) is not None)
+    if data in (None, 'None', '', [], {}):
+        return None
+    if isinstance(data, str):
+        data = data.strip()
+    return data
+
+
+def bench(fn, payloads):
+    start = time.perf_counter()
+    for p_ in payloads:
+        fn(p_)
+    return len(payloads) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the APN payload normalization.')
+    parser.add_argument("-n", "--docs", type=int, default=200)
+    parser.add_argument("--experiences", type=int, default=60)
+    parser.add_argument("--skills", type=int, default=300)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+    raw = [json.dumps(make_talent(i_, args.experiences, args.skills)) for i_ in range(args.docs)]
+    print(f"{args.docs} talents of {sum(map(len, raw)) / len(raw) / 1024:.1f} KB")
+    for name, fn in (('recursive + talent_v1_to_v2', lambda d_: talent_v1_to_v2(format_talent_data(d_))),
+                     ('PayloadNormalizer (fused)', TALENT_V2_NORMALIZER)):
+        rates = []
+        for _ in range(args.repeat):
+            # the normalizer works in place, every run gets freshly parsed payloads
+            rates.append(bench(fn, [json.loads(r_) for r_ in raw]))
+        print(f"{name:<30s} {max(rates):10.1f} docs/sec (best of {args.repeat})")
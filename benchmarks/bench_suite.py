@@ -0,0 +1,185 @@
+"""
+throughput and peak memory of the formatters, the Doc construction and the condition check path
+on synthetic small/medium/large documents, offline against the local stand-in servers,
+compared with the baselines stored in benchmarks/baselines.json (written by --save, per machine)
+python3 -m benchmarks.bench_suite [-k build. check.] [--sizes small large] [--save] [--tolerance 0.2]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+import data_harvester
+from benchmarks.standins import StandInES
+from benchmarks.synthetic import SIZES, make_apn_doc, make_hit
+from benchmarks.bench_harvest import make_rows, run as run_harvest
+from lib.payload_normalizer import JOB_NORMALIZER, TALENT_NORMALIZER, JOB_V2_NORMALIZER, TALENT_V2_NORMALIZER
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+
+def normalize(normalizer, raw):
+    # the normalizers work in place, every run gets freshly parsed payloads
+    docs = [json.loads(r_) for r_ in raw]
+    return lambda: [normalizer(d_) for d_ in docs]
+
+
+def format_job(raw):
+    from lib.job_formatter import job_v1_to_v2
+    docs = [JOB_NORMALIZER(json.loads(r_)) for r_ in raw]
+    return lambda: [job_v1_to_v2(d_) for d_ in docs]
+
+
+def format_talent(raw):
+    from lib.talent_formatter import talent_v1_to_v2
+    docs = [TALENT_NORMALIZER(json.loads(r_)) for r_ in raw]
+    return lambda: [talent_v1_to_v2(d_) for d_ in docs]
+
+
+def build_job(hits):
+    from lib.datatype.job import Job
+    return lambda: [Job(h_).get_required_conditions() for h_ in hits]
+
+
+def build_talent(hits):
+    from lib.datatype.talent import Talent
+    now = datetime.now()
+
+    def build():
+        for h_ in hits:
+            t_ = Talent(h_, now)
+            t_.posting_days, t_.current_career_years, t_.university_rank, t_.view
+    return build
+
+
+def check_condition(es, hits, named_queries, talents=None):
+    """
+    :param talents: hits of the talents checked in process, None to check with the stand-in ES
+    """
+    index_ = f'talents_{data_harvester.TENANT_ID}'
+    es.docs.setdefault(index_, {}).update({str(i_): {} for i_ in range(len(hits))})
+    conditions = [data_harvester.build_conditions(h_['_id'], h_)[0] for h_ in hits]
+    local, sources = None, [None] * len(hits)
+    if talents:
+        local = data_harvester.LocalConditions(data_harvester.create_evaluator())
+        sources = [t_['_source'] for t_ in talents]
+    return lambda: [data_harvester.ConditionChecker(index_, i_, c_, named_queries=named_queries, source=s_,
+                                                    local=local).find_unsatisfied_conditions()
+                    for i_, (c_, s_) in enumerate(zip(conditions, sources))]
+
+
+def harvest(n, size):
+    rows = make_rows(n, max(1, n // 10), n)
+
+    def run():
+        # run_harvest points TARGET_ES to its own stand-in
+        previous = data_harvester.TARGET_ES
+        try:
+            return run_harvest(rows, 4, 0., 0.9, size=size)[0]
+        finally:
+            data_harvester.TARGET_ES = previous
+    return run
+
+
+def cases(es, size, n):
+    """
+    :return: {name: prepare}, prepare() gives a fresh callable running the case over n documents once
+    """
+    raw_jobs = [json.dumps(make_apn_doc('job', i_, size)) for i_ in range(n)]
+    raw_talents = [json.dumps(make_apn_doc('talent', i_, size)) for i_ in range(n)]
+    job_hits = [make_hit('job', i_, size, tenant_id=data_harvester.TENANT_ID) for i_ in range(n)]
+    talent_hits = [make_hit('talent', i_, size, tenant_id=data_harvester.TENANT_ID) for i_ in range(n)]
+    return {
+        'normalize.job': lambda: normalize(JOB_V2_NORMALIZER, raw_jobs),
+        'normalize.talent': lambda: normalize(TALENT_V2_NORMALIZER, raw_talents),
+        'format.job_v1_to_v2': lambda: format_job(raw_jobs),
+        'format.talent_v1_to_v2': lambda: format_talent(raw_talents),
+        'build.job': lambda: build_job(job_hits),
+        'build.talent': lambda: build_talent(talent_hits),
+        'check.count': lambda: check_condition(es, job_hits, False),
+        'check.named_queries': lambda: check_condition(es, job_hits, True),
+        'check.local': lambda: check_condition(es, job_hits, False, talent_hits),
+        'check.local_named_queries': lambda: check_condition(es, job_hits, True, talent_hits),
+        'harvest': lambda: harvest(n, size),
+    }
+
+
+@contextmanager
+def target_es(es):
+    from libsearcher.pylibshared.utils.elastic import ESClient
+    previous, data_harvester.TARGET_ES = data_harvester.TARGET_ES, ESClient(es.address)
+    try:
+        yield
+    finally:
+        data_harvester.TARGET_ES = previous
+
+
+def measure(prepare, n, repeat):
+    """
+    :return: (best items/sec of repeat runs, peak KB allocated by a run traced separately)
+             a case returning a float reports its own rate, e.g. harvest which does not count the server setup
+    """
+    rates = []
+    for _ in range(repeat):
+        fn = prepare()
+        start = time.perf_counter()
+        rate = fn()
+        rates.append(rate if isinstance(rate, float) else n / (time.perf_counter() - start))
+    fn = prepare()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(rates), peak / 1024
+
+
+def compare(result, baseline, tolerance):
+    """
+    :return: flags of the regressions beyond tolerance, e.g. ['slower x0.71']
+    """
+    flags = []
+    if baseline is None:
+        return ['no baseline']
+    if result['ops_per_sec'] < baseline['ops_per_sec'] * (1 - tolerance):
+        flags.append(f"slower x{result['ops_per_sec'] / baseline['ops_per_sec']:.2f}")
+    if result['peak_kb'] > baseline['peak_kb'] * (1 + tolerance):
+        flags.append(f"memory x{result['peak_kb'] / baseline['peak_kb']:.2f}")
+    return flags
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the formatters, the docs and the condition check.')
+    parser.add_argument("-k", "--keys", nargs='*', default=[], help='run only the cases starting with these;')
+    parser.add_argument("--sizes", nargs='+', choices=tuple(SIZES), default=list(SIZES))
+    parser.add_argument("-n", "--docs", type=int, default=100, help='documents per case;')
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.2, help='relative slowdown or growth flagged;')
+    parser.add_argument("--baselines", type=str, default=BASELINES)
+    parser.add_argument("--save", action='store_true', help='store the results as the new baselines;')
+    args = parser.parse_args()
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding='utf-8') as f_:
+            baselines = json.load(f_)
+    results, regressions = {}, 0
+    with StandInES() as es_, target_es(es_):
+        for size_ in args.sizes:
+            for name_, prepare_ in cases(es_, size_, args.docs).items():
+                if args.keys and not name_.startswith(tuple(args.keys)):
+                    continue
+                key_ = f"{name_}[{size_}]"
+                rate_, peak_ = measure(prepare_, args.docs, args.repeat)
+                results[key_] = {'ops_per_sec': round(rate_, 2), 'peak_kb': round(peak_, 1)}
+                flags_ = [] if args.save else compare(results[key_], baselines.get(key_), args.tolerance)
+                regressions += any(f_ != 'no baseline' for f_ in flags_)
+                print(f"{key_:<36s} {rate_:12.1f} ops/sec {peak_:12.1f} KB peak  {' '.join(flags_)}")
+    if args.save:
+        baselines.update(results)
+        with open(args.baselines, 'w', encoding='utf-8') as f_:
+            json.dump(baselines, f_, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} baselines to {args.baselines}")
+    sys.exit(1 if regressions else 0)
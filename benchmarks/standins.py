@@ -0,0 +1,165 @@
+"""
+Local stand-in HTTP servers for ES, APN and ESFiller, used by the benchmarks to run offline.
+Each server answers only the endpoints the harvester calls, with a configurable latency per request.
+"""
+import re
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StandInServer:
+    """
+    a threaded HTTP server in a background thread, routes are (method, regex, handler)
+    handler(match, body) returns (status, json-able response)
+    """
+    def __init__(self, latency=0.0):
+        self._latency = latency
+        self._routes = []
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length', 0) or 0)
+                body = json.loads(self.rfile.read(length) or b'null') if length else None
+                status, response = server.dispatch(self.command, self.path.split('?')[0], body)
+                payload = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('localhost', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def route(self, method, pattern, handler):
+        self._routes.append((method, re.compile(pattern + '$'), handler))
+
+    def dispatch(self, method, path, body):
+        self.requests += 1
+        if self._latency:
+            time.sleep(self._latency)
+        for method_, pattern_, handler_ in self._routes:
+            if method_ == method and (m_ := pattern_.match(path)):
+                return handler_(m_, body)
+        return 404, {"error": f"no route for {method} {path}"}
+
+    @property
+    def address(self):
+        return f"localhost:{self._httpd.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StandInES(StandInServer):
+    """
+    in-memory documents by index, answers get/mget/delete/index/count/search, every query matches
+    """
+    def __init__(self, docs=None, latency=0.0):
+        super().__init__(latency)
+        self.docs = docs if docs is not None else {}
+        self.route('GET', r'/([^/]+)/_doc/([^/]+)', self._get)
+        self.route('HEAD', r'/([^/]+)/_doc/([^/]+)', self._get)
+        self.route('DELETE', r'/([^/]+)/_doc/([^/]+)', self._delete)
+        self.route('PUT', r'/([^/]+)/_doc/([^/]+)', self._put)
+        self.route('POST', r'/([^/]+)/_doc/([^/]+)', self._put)
+        self.route('POST', r'/([^/]+)/_mget', self._mget)
+        self.route('GET', r'/([^/]+)/_mget', self._mget)
+        self.route('POST', r'/([^/]+)/_search', self._search)
+        self.route('GET', r'/([^/]+)/_search', self._search)
+        self.route('POST', r'/([^/]+)/_count', self._count)
+        self.route('GET', r'/([^/]+)/_count', self._count)
+        self.route('GET', r'/', lambda m_, b_: (200, {"version": {"number": "7.8.1"}}))
+
+    def _get(self, m_, body):
+        index_, id_ = m_.groups()
+        if (source := self.docs.get(index_, {}).get(id_)) is None:
+            return 404, {"_index": index_, "_id": id_, "found": False}
+        return 200, {"_index": index_, "_id": id_, "_version": 1, "found": True, "_source": source}
+
+    def _mget(self, m_, body):
+        index_ = m_.group(1)
+        docs = []
+        for id_ in body.get('ids', []):
+            if (source := self.docs.get(index_, {}).get(id_)) is None:
+                docs.append({"_index": index_, "_id": id_, "found": False})
+            else:
+                docs.append({"_index": index_, "_id": id_, "_version": 1, "found": True, "_source": source})
+        return 200, {"docs": docs}
+
+    def _delete(self, m_, body):
+        index_, id_ = m_.groups()
+        found = self.docs.get(index_, {}).pop(id_, None) is not None
+        return (200 if found else 404), {"_index": index_, "_id": id_, "result": "deleted" if found else "not_found"}
+
+    def _put(self, m_, body):
+        index_, id_ = m_.groups()
+        self.docs.setdefault(index_, {})[id_] = body
+        return 200, {"_index": index_, "_id": id_, "result": "created"}
+
+    def _count(self, m_, body):
+        return 200, {"count": 1}
+
+    def _search(self, m_, body):
+        """
+        a hit matching every named should clause for each doc whose id appears in the filter
+        """
+        query = (body or {}).get('query', {}).get('bool', {})
+        names = [q_['bool']['_name'] for q_ in query.get('should', []) if '_name' in q_.get('bool', {})]
+        docs = self.docs.get(m_.group(1), {})
+        ids, stack = [], [query.get('filter', [])]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, str) and node in docs:
+                ids.append(node)
+        hits = [{"_index": m_.group(1), "_id": id_, "_score": 1.0, "matched_queries": names}
+                for id_ in dict.fromkeys(ids)]
+        return 200, {"hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+
+class StandInAPN(StandInServer):
+    """
+    serves generated job and talent payloads, doc_factory(kind, id_) -> dict
+    """
+    def __init__(self, doc_factory, latency=0.0):
+        super().__init__(latency)
+        self.route('POST', r'/api/v1/refresh-token', lambda m_, b_: (200, {"access_token": "stand-in"}))
+        self.route('GET', r'/api/v1/talents/([0-9]+)', lambda m_, b_: (200, doc_factory('talent', m_.group(1))))
+        self.route('GET', r'/api/v1/jobs/([0-9]+)', lambda m_, b_: (200, doc_factory('job', m_.group(1))))
+
+
+class StandInESFiller(StandInServer):
+    """
+    echoes the posted document as the filled one and stores it into the stand-in ES
+    """
+    def __init__(self, es: StandInES = None, latency=0.0):
+        super().__init__(latency)
+        self._es = es
+        self.route('POST', r'/filler/v2/sync/tenant/([^/]+)/(job|talent)/([^/]+)/fill_es/', self._fill)
+
+    def _fill(self, m_, body):
+        tenant_, kind_, id_ = m_.groups()
+        if self._es is not None:
+            self._es.docs.setdefault(f"{kind_}s_{tenant_}", {})[id_] = body
+        return 200, body
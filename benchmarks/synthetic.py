@@ -0,0 +1,71 @@
+"""
+Generators of realistic APN job and talent payloads and of the ES hits filled from them,
+at the sizes of SIZES, e.g. a large talent has 60 experiences and 300 skills.
+The documents are deterministic given (id, size, seed).
+"""
+import json
+import random
+from lib.payload_normalizer import JOB_V2_NORMALIZER, TALENT_V2_NORMALIZER
+SIZES = {
+    'small': {'n_experiences': 2, 'n_skills': 10, 'n_educations': 1, 'n_keywords': 3},
+    'medium': {'n_experiences': 10, 'n_skills': 60, 'n_educations': 2, 'n_keywords': 10},
+    'large': {'n_experiences': 60, 'n_skills': 300, 'n_educations': 4, 'n_keywords': 40},
+}
+TITLES = ("Software Engineer", "Senior Engineer ", "Lead", "Data Scientist", "Backend Engineer", "QA Engineer")
+KEYWORDS = ("python", "java", "kubernetes", "go", "sql", "react", "spark", "aws", "docker", "linux")
+DEGREES = ("Bachelor", "Master", "PhD")
+LANGUAGES = ("English", "Chinese", "Spanish")
+
+
+def make_talent(id_, n_experiences, n_skills, n_educations=4, seed=0):
+    rnd = random.Random(seed + id_)
+    maybe = lambda v: rnd.choice((v, None, '', 'None', [], v))
+    return {
+        "id": id_, "tenantId": 4, "createdBy": "1,4", "createdDate": "2020-01-01T00:00:00Z",
+        "lastModifiedDate": "2020-06-01T00:00:00Z", "fullName": f" Talent {id_} ", "title": "Software Engineer",
+        "company": "Acme", "currency": "USD", "photoUrl": maybe("http://x/y.png"), "notes": [],
+        "contacts": [{"type": "EMAIL", "details": f"t{id_}@x.com", "id": 1, "createdDate": None}],
+        "experiences": [{"title": rnd.choice(TITLES), "company": f"Company {e_}", "startDate": "2010-01-01",
+                         "endDate": maybe("2012-01-01"), "current": e_ == 0, "description": maybe(" did things " * 20),
+                         "id": e_, "workLocation": maybe({"city": "Seattle", "country": "US", "zipcode": None})}
+                        for e_ in range(n_experiences)],
+        "educations": [{"collegeName": f"College {e_}", "degreeName": maybe("Bachelor"), "majorName": " CS ",
+                        "startDate": "2005-09-01", "endDate": "2009-06-01", "collegeWorldRank": maybe(100 + e_)}
+                       for e_ in range(n_educations)],
+        "skills": [{"skillName": f"skill {s_}" if s_ >= len(KEYWORDS) else KEYWORDS[s_], "score": rnd.random(),
+                    "necessity": None, "current": rnd.random() < 0.5, "lastUsed": maybe("2019-01-01"),
+                    "usedMonth": rnd.randint(0, 99), "firstUsed": maybe("2011-01-01")} for s_ in range(n_skills)],
+        "languages": ["ENGLISH", maybe("CHINESE")],
+    }
+
+
+def make_job(id_, n_skills, n_keywords, seed=0, **_):
+    rnd = random.Random(seed + id_)
+    keywords = [rnd.choice(KEYWORDS + DEGREES + LANGUAGES) if k_ >= len(KEYWORDS) else KEYWORDS[k_]
+                for k_ in range(n_keywords)]
+    return {"id": id_, "title": "Senior Software Engineer|Backend Engineer", "jobType": "FULL_TIME",
+            "city": "Seattle", "province": "WA", "country": "US", "expLevels": ["SENIOR"],
+            "requiredKeywords": json.dumps(keywords[:max(1, n_keywords // 2)] + ["Bachelor", "English"]),
+            "keywords": json.dumps(keywords[n_keywords // 2:]), "createdDate": "2020-01-01T00:00:00Z",
+            "skills": [{"id": s_, "skillName": f"skill {s_}" if s_ >= len(KEYWORDS) else KEYWORDS[s_],
+                        "score": rnd.randint(1, 3), "necessity": rnd.choice(("REQUIRED", "PREFERRED"))}
+                       for s_ in range(n_skills)]}
+
+
+def make_apn_doc(kind, id_, size='small', seed=0):
+    """
+    APN payload of a job or a talent, e.g. served by StandInAPN
+    """
+    counts = SIZES[size]
+    if kind == 'job':
+        return make_job(int(id_), seed=seed, **counts)
+    return make_talent(int(id_), counts['n_experiences'], counts['n_skills'], counts['n_educations'], seed=seed)
+
+
+def make_hit(kind, id_, size='small', seed=0, tenant_id='10'):
+    """
+    ES hit of the document ESFiller would index from make_apn_doc(kind, id_, size)
+    """
+    normalize = JOB_V2_NORMALIZER if kind == 'job' else TALENT_V2_NORMALIZER
+    return {"_index": f"{kind}s_{tenant_id}", "_id": str(id_), "_version": 1,
+            "_source": normalize(make_apn_doc(kind, id_, size, seed))}
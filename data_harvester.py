@@ -1,26 +1,57 @@
-import time
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import json
+import zlib
+import queue
 import pprint
-import pandas as pd
+import logging
+import threading
+import traceback
+from types import SimpleNamespace
 from lib.connectors import APN, MariaDBFetcher, ESFiller
-from lib.datatype.job import Job
-from lib.job_formatter import job_v1_to_v2
-from lib.talent_formatter import talent_v1_to_v2
-from libsearcher.pylibshared.utils.elastic import ESClient, DocNotFoundError
-from libsearcher import TalentConditions, KeywordSearcher, Operator
-from libsearcher.pylibshared.utils.logger import get_logger
+from lib.apn_cache import APNCache
+from lib.doc_resolver import DocResolver, fill_job, fill_talent
+from lib.job_cache import JobCache
+from lib.progress_journal import ProgressJournal
+from lib.metrics import METRICS
+from lib.profiling import PROFILER
+from lib import log
+from lib.lazy import Lazy, lazy_logger
+# pandas and libsearcher are imported where they are used, so that short runs and workers start fast
 pp = pprint.PrettyPrinter(indent=4, width=200)
-logger = get_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
-TARGET_ES = ESClient("localhost:9200")
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+
+
+def create_target_es():
+    from libsearcher.pylibshared.utils.elastic import ESClient
+    return ESClient("localhost:9200")
+
+
+TARGET_ES = Lazy(create_target_es)
 TENANT_ID = '10'
 CHECKERS = ('Amos',)
 SELECT_COLUMNS = {"talent_id": 'int64', "job_id": 'int64'}
 
 
 class CheckedData:
-    def __init__(self, filename):
-        self._df = pd.read_csv(filename, delimiter=',', usecols=[0, 1, 2, 8, 9],
+    USE_COLUMNS = [0, 1, 2, 8, 9]
+    DTYPES = {"talent_id": 'int64', "job_id": 'int64', "job_duty": 'category', "talent_duty": 'category'}
+    ARROW_SUFFIXES = ('.parquet', '.arrow', '.feather')
+
+    def __init__(self, filename, chunksize=None):
+        """
+        :param filename: csv, or parquet/arrow file with the same columns
+        :param chunksize: stream the file by chunks of this many rows in constant memory,
+                          None to load the whole csv at once; parquet/arrow files are always streamed
+        """
+        self._filename = filename
+        self._chunksize = chunksize or 100000
+        self._df = None
+        if chunksize or filename.endswith(self.ARROW_SUFFIXES):
+            return
+        import pandas as pd
+        self._df = pd.read_csv(filename, delimiter=',', usecols=self.USE_COLUMNS,
                                dtype={"talent_id": 'int64', "job_id": 'int64'})
         self._df = self._df[self._df.job_duty.isin(CHECKERS) & self._df.talent_duty.isin(CHECKERS)]
         # self._df = self._df[self._df.interviewed].filter(items=('talent_id', 'job_id'))
@@ -28,24 +59,209 @@ class CheckedData:
         print(self._df[-5:])
         print(self._df.shape)
 
+    def __read_chunks(self):
+        if self._filename.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            file_ = pq.ParquetFile(self._filename)
+            columns = [file_.schema_arrow.names[c_] for c_ in self.USE_COLUMNS]
+            for batch in file_.iter_batches(batch_size=self._chunksize, columns=columns):
+                yield batch.to_pandas()
+        elif self._filename.endswith(('.arrow', '.feather')):
+            import pyarrow as pa
+            with pa.memory_map(self._filename) as source:
+                reader = pa.ipc.open_file(source)
+                columns = [reader.schema.names[c_] for c_ in self.USE_COLUMNS]
+                for b_ in range(reader.num_record_batches):
+                    yield reader.get_batch(b_).select(columns).to_pandas()
+        else:
+            import pandas as pd
+            yield from pd.read_csv(self._filename, delimiter=',', usecols=self.USE_COLUMNS,
+                                   dtype=self.DTYPES, chunksize=self._chunksize)
+
+    def fetch_chunks(self):
+        """
+        :return: generator of DataFrames of the rows checked by CHECKERS
+        """
+        if self._df is not None:
+            yield self._df
+            return
+        for chunk in self.__read_chunks():
+            yield chunk[chunk.job_duty.isin(CHECKERS) & chunk.talent_duty.isin(CHECKERS)]
+
     def fetch(self):
-        for row in self._df.itertuples(index=False):
-            yield row
+        for chunk in self.fetch_chunks():
+            for row in chunk.itertuples(index=False):
+                yield row
+
+    def fetch_by_job(self, skip=None):
+        """
+        the rows are grouped per chunk so that a streamed file stays in constant memory: a job whose rows are in
+        several chunks comes in several groups, its built conditions are then reused from the job cache
+        :param skip: skip(row) is True for the rows not to be checked, e.g. already checked by a previous run
+        :return: generator of (job_id, [(i, row), ...]), jobs in the order of their first rows in the chunk,
+                 i starts from 1 in the whole input
+        """
+        i = 0
+        for chunk in self.fetch_chunks():
+            groups = {}
+            for i, row in enumerate(chunk.itertuples(index=False), i + 1):
+                if skip and skip(row):
+                    continue
+                groups.setdefault(row.job_id, []).append((i, row))
+            yield from groups.items()
+
+
+def expandable(cond_):
+    """
+    an unsatisfied must/filter collection is reported by its sub-conditions
+    """
+    from libsearcher import Operator
+    return hasattr(cond_, '_operator') and cond_._operator in (Operator.must, Operator.filter) \
+        and len(cond_._conditions) > 1
+
+
+def compile_conditions(conditions):
+    from libsearcher import TalentConditions, Operator
+    all_conditions = TalentConditions(conditions=conditions, operator=Operator.must)
+    if f_ := all_conditions.invalid_fields:
+        raise ValueError('Invalid Field:', json.dumps(f_, indent=4))
+    return all_conditions.es_condition
+
+
+def compiled(cache_entry, key, compile_):
+    """
+    :param cache_entry: JobCacheEntry holding the conditions, None to compile without caching
+    """
+    return cache_entry.compiled(key, compile_) if cache_entry else compile_()
+
+
+def id_filter(ids):
+    from libsearcher import TalentConditions, KeywordSearcher, Operator
+    id_search = KeywordSearcher(keywords=[str(id_) for id_ in ids], key='_id')
+    return TalentConditions(conditions=[id_search], operator=Operator.must).es_condition
+
+
+def named_condition(name, conditions):
+    from libsearcher import TalentConditions, Operator
+    return {"bool": {"must": [TalentConditions(conditions=conditions, operator=Operator.must).es_condition],
+                     "_name": name}}
+
+
+def named_conditions(conditions):
+    """
+    :return: queries of the conditions tagged "i", and of the sub-conditions of expandable ones tagged "i.j"
+    """
+    from libsearcher import TalentConditions, Operator
+    if f_ := TalentConditions(conditions=conditions, operator=Operator.must).invalid_fields:
+        raise ValueError('Invalid Field:', json.dumps(f_, indent=4))
+    named = []
+    for i_, cond_ in enumerate(conditions):
+        named.append(named_condition(f"{i_}", [cond_]))
+        if expandable(cond_):
+            for j_, cond__ in enumerate(cond_._conditions):
+                named.append(named_condition(f"{i_}.{j_}", [cond__]))
+    return named
+
+
+def read_unsatisfied_conditions(conditions, matched_queries):
+    """
+    :return: the unsatisfied conditions given the names matched by named_conditions(), None if all are matched
+    """
+    unsatisfied_conditions = []
+    for i_, cond_ in enumerate(conditions):
+        if f"{i_}" in matched_queries:
+            continue
+        if expandable(cond_):
+            unsatisfied_conditions.extend(cond_._conditions)
+        else:
+            unsatisfied_conditions.append(cond_)
+    return unsatisfied_conditions or None
+
+
+class LocalConditions:
+    """
+    evaluates the compiled conditions on the talent _source in process instead of asking ES,
+    the queries the evaluator cannot tell are still left to ES
+    """
+    def __init__(self, evaluator, parity=False):
+        """
+        :param evaluator: ConditionEvaluator
+        :param parity: also ask ES and log the verdicts which differ, to validate the evaluator on real data
+        """
+        self.evaluator = evaluator
+        self.parity = parity
+
+    def matches(self, query, scope, remote):
+        """
+        :param scope: Scope of the talent _source
+        :param remote: remote() gives the verdict of ES, None when the caller checks parity itself
+        :return: whether the talent matches the query, None if the evaluator cannot tell
+        """
+        return self.__evaluate(lambda: self.evaluator.matches(query, scope), scope, remote)
+
+    def matched_names(self, named, scope, remote):
+        """
+        :return: names of the matched named queries, None if the evaluator cannot tell, see matches
+        """
+        return self.__evaluate(lambda: self.evaluator.matched_names(named, scope), scope, remote)
+
+    def __evaluate(self, evaluate, scope, remote):
+        from lib.condition_evaluator import UnsupportedQuery
+        try:
+            with METRICS.timer('local.evaluate'):
+                verdict = evaluate()
+        except UnsupportedQuery as e_:
+            METRICS.count('local.fallbacks')
+            logger.debug("Talent %s checked by ES: %s", scope.id, e_)
+            return None
+        if self.parity and remote:
+            self.check_parity(scope.id, verdict, remote())
+        return verdict
+
+    @staticmethod
+    def check_parity(id_, verdict, remote_verdict):
+        METRICS.count('parity.checks')
+        if verdict != remote_verdict:
+            METRICS.count('parity.mismatches')
+            logger.warning("Talent %s: local verdict %s, ES verdict %s", id_, verdict, remote_verdict)
 
 
 class ConditionChecker:
-    def __init__(self, index_, id_, conditions):
+    def __init__(self, index_, id_, conditions, named_queries=False, cache_entry=None, source=None, local=None):
+        """
+        :param named_queries: diagnose with one search whose conditions are tagged by names,
+                              instead of one count for all the conditions and one more per condition
+        :param cache_entry: JobCacheEntry the conditions come from, its compiled ES DSL are reused
+        :param source: _source of the talent, checked in process by local when given
+        :param local: LocalConditions, None to check every condition with ES
+        """
+        from lib.condition_evaluator import Scope
         self.__index = index_
         self.__id = str(id_)
         self.__all_conditions = list(filter(None, conditions)) if conditions else None
+        self.__named_queries = named_queries
+        self.__cache_entry = cache_entry
+        self.__local = local if source is not None else None
+        self.__scope = Scope(source, self.__id) if self.__local else None
+        self.__matched_queries = None
+
+    @property
+    def matched_queries(self):
+        """
+        names of the matched conditions of the last named queries diagnosis: "i" for the i-th condition
+        and "i.j" for the j-th sub-condition of an expandable one
+        """
+        return self.__matched_queries
 
     def find_unsatisfied_conditions(self):
+        if self.__named_queries:
+            return self.__diagnose()
         if self.__check_conditions(self.__all_conditions):
             return None
         unsatisfied_conditions = []
         for cond_ in self.__all_conditions:
             if not self.__check_conditions([cond_]):
-                if hasattr(cond_, '_operator') and cond_._operator in (Operator.must, Operator.filter) and len(cond_._conditions) > 1:
+                if expandable(cond_):
                     for cond__ in cond_._conditions:
                         unsatisfied_conditions.append(cond__)
                 else:
@@ -53,64 +269,557 @@ class ConditionChecker:
         return unsatisfied_conditions
 
     def __check_conditions(self, conditions):
-        id_search = KeywordSearcher(keywords=[self.__id], key='_id')
-        all_conditions = TalentConditions(conditions=conditions + [id_search], operator=Operator.must)
-        if f_ := all_conditions.invalid_fields:
-            raise ValueError('Invalid Field:', json.dumps(f_, indent=4))
-        es_condition = all_conditions.es_condition
-        if TARGET_ES.count(index=self.__index, body={"query": es_condition}):
-            return True
-        else:
-            return False
+        es_condition = compiled(self.__cache_entry, ('count',) + tuple(map(id, conditions)),
+                                lambda: compile_conditions(conditions))
+        if self.__local and (matched := self.__local.matches(es_condition, self.__scope,
+                                                              lambda: self.__count(es_condition))) is not None:
+            return matched
+        return self.__count(es_condition)
 
+    def __count(self, es_condition):
+        es_condition = {"bool": {"filter": [id_filter([self.__id])], "must": [es_condition]}}
+        with METRICS.timer('es.count'):
+            return bool(TARGET_ES.count(index=self.__index, body={"query": es_condition}))
 
-def main():
-    checked_data = CheckedData('data/训练数据修正 - application_202005251554.csv')
-    apn = APN(host='https://api.hitalentech.com', refresh_token=args.refresh_token)
-    es_filler = ESFiller()
-    i = 0
-    for row in checked_data.fetch():
-        i += 1
-        if i < 0:
-            continue
-        try:
+    def __diagnose(self):
+        conditions = self.__all_conditions or []
+        named = compiled(self.__cache_entry, ('named',) + tuple(map(id, conditions)),
+                         lambda: named_conditions(conditions))
+        if not self.__local or (matched := self.__local.matched_names(named, self.__scope,
+                                                                      lambda: self.__search(named))) is None:
+            matched = self.__search(named)
+        self.__matched_queries = matched
+        return read_unsatisfied_conditions(conditions, self.__matched_queries)
+
+    def __search(self, named):
+        body = {"query": {"bool": {"filter": [id_filter([self.__id])], "should": named}},
+                "size": 1, "_source": False}
+        with METRICS.timer('es.search'):
+            hits = TARGET_ES.search(index=self.__index, body=body)['hits']['hits']
+        return set(hits[0].get('matched_queries', [])) if hits else set()
+
+
+class JobBatchChecker:
+    """
+    checks the required conditions of one job against all its talents, with one search per batch of talents
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, index_, talent_ids, conditions, cache_entry=None, sources=None, local=None):
+        """
+        :param sources: [_source of the talent or None, ...] along talent_ids, the known ones are checked by local
+        :param local: LocalConditions, None to check every talent with ES
+        """
+        self.__index = index_
+        self.__talent_ids = list(dict.fromkeys(str(id_) for id_ in talent_ids))
+        self.__all_conditions = list(filter(None, conditions)) if conditions else []
+        self.__cache_entry = cache_entry
+        self.__local = local
+        self.__sources = {str(id_): s_ for id_, s_ in zip(talent_ids, sources or ()) if s_ is not None} \
+            if local else {}
+
+    def check(self):
+        """
+        :return: (ids of the talents which have passed check, {talent id: unsatisfied conditions} of the others)
+        """
+        named = compiled(self.__cache_entry, ('named',) + tuple(map(id, self.__all_conditions)),
+                         lambda: named_conditions(self.__all_conditions))
+        matched = self.__evaluate(named)
+        remote_ids = [id_ for id_ in self.__talent_ids if id_ not in matched]
+        if self.__local and self.__local.parity:
+            # ES checks them all, the local verdicts are compared with its own
+            remote_ids = self.__talent_ids
+        passed, failures = set(), {}
+        for start in range(0, len(remote_ids), self.BATCH_SIZE):
+            ids = remote_ids[start:start + self.BATCH_SIZE]
+            body = {"query": {"bool": {"filter": [id_filter(ids)], "should": named}},
+                    "size": len(ids), "_source": False}
+            with METRICS.timer('es.search'):
+                hits = TARGET_ES.search(index=self.__index, body=body)['hits']['hits']
+            remote = {hit_['_id']: set(hit_.get('matched_queries', [])) for hit_ in hits}
+            for id_ in ids:
+                if id_ in matched:
+                    LocalConditions.check_parity(id_, matched[id_], remote.get(id_, set()))
+                else:
+                    matched[id_] = remote.get(id_, set())
+        for id_ in self.__talent_ids:
+            # a talent missing in the index satisfies nothing
+            if cs_ := read_unsatisfied_conditions(self.__all_conditions, matched[id_]):
+                failures[id_] = cs_
+            else:
+                passed.add(id_)
+        return passed, failures
+
+    def __evaluate(self, named):
+        """
+        :return: {talent id: matched names} of the talents the evaluator could tell
+        """
+        from lib.condition_evaluator import Scope
+        matched = {}
+        for id_, source in self.__sources.items():
+            # parity is checked against the batch searches, not one search per talent
+            if (names := self.__local.matched_names(named, Scope(source, id_), None)) is not None:
+                matched[id_] = names
+        return matched
+
+
+def resolve_job(i, row, apn, es_filler):
+    from libsearcher.pylibshared.utils.elastic import DocNotFoundError
+    try:
+        with METRICS.timer('es.get_doc'):
             j_ = TARGET_ES.get_doc('jobs_' + TENANT_ID, str(row.job_id))
-            job_filled = j_['_source']
-            if 'error' in job_filled:
-                TARGET_ES.delete('jobs_' + TENANT_ID, str(row.job_id))
-                raise DocNotFoundError(f"{i} - job {row.job_id} - {job_filled} doc broken")
-            # logger.debug(f"Job {row.job_id} is already in ES.")
-        except DocNotFoundError:
-            job_apn_json = job_v1_to_v2(apn.get_job(row.job_id))
-            job_filled = es_filler.fill_job(job_apn_json, row.job_id)
-            j_ = {"_id": "dummy", "_index": "dummy", "_source": job_filled}
-        try:
+        job_filled = j_['_source']
+        if 'error' in job_filled:
+            METRICS.count('broken_docs')
+            TARGET_ES.delete('jobs_' + TENANT_ID, str(row.job_id))
+            raise DocNotFoundError(f"{i} - job {row.job_id} - {job_filled} doc broken")
+        # logger.debug(f"Job {row.job_id} is already in ES.")
+    except DocNotFoundError:
+        j_ = fill_job(apn, es_filler, row.job_id)
+    return j_
+
+
+def resolve_talent(i, row, apn, es_filler):
+    from libsearcher.pylibshared.utils.elastic import DocNotFoundError
+    try:
+        with METRICS.timer('es.get_doc'):
             t_ = TARGET_ES.get_doc('talents_' + TENANT_ID, str(row.talent_id))
-            talent_filled = t_['_source']
-            if 'error' in talent_filled:
-                TARGET_ES.delete('talents_' + TENANT_ID, str(row.talent_id))
-                raise DocNotFoundError(f"{i} - talent {row.talent_id} - {talent_filled} doc broken")
-            # logger.debug(f"Talent {row.talent_id} is already in ES.")
-        except DocNotFoundError:
-            talent_apn_json = talent_v1_to_v2(apn.get_talent(row.talent_id))
+        talent_filled = t_['_source']
+        if 'error' in talent_filled:
+            METRICS.count('broken_docs')
+            TARGET_ES.delete('talents_' + TENANT_ID, str(row.talent_id))
+            raise DocNotFoundError(f"{i} - talent {row.talent_id} - {talent_filled} doc broken")
+        # logger.debug(f"Talent {row.talent_id} is already in ES.")
+    except DocNotFoundError:
+        talent_filled = fill_talent(apn, es_filler, row.talent_id)
+    return talent_filled
+
+
+def build_conditions(job_id, j_, job_cache=None):
+    """
+    :return: (required conditions of the job, JobCacheEntry or None without job_cache, Job)
+    """
+    if job_cache is None:
+        from lib.datatype.job import Job
+        job = Job(j_)
+        return job.get_required_conditions(), None, job
+    entry = job_cache.get(job_id, j_)
+    return entry.conditions, entry, entry.job
+
+
+def named_unsatisfied(job, cs_):
+    """
+    :return: the unsatisfied conditions as Unsatisfied, named after the required conditions of the job
+    """
+    return [Unsatisfied(c_, job.condition_name(c_)) for c_ in cs_] if cs_ else cs_
+
+
+def check_row(i, row, apn, es_filler, resolver=None, named_queries=False, job_cache=None, local=None):
+    """
+    fetch (or fill) the job and the talent of a row and check the job requirements against the talent
+    :param resolver: DocResolver which has prefetched the row, None to get the docs one by one
+    :param named_queries: diagnose the conditions with one search, see ConditionChecker
+    :param job_cache: JobCache of the built jobs and their compiled conditions
+    :param local: LocalConditions checking the talent _source in process, None to check with ES
+    :return: the unsatisfied conditions as Unsatisfied, None if the talent has passed check
+    """
+    if resolver:
+        j_ = resolver.get_job(row.job_id)
+        talent_ = resolver.get_talent(row.talent_id)
+    else:
+        j_ = resolve_job(i, row, apn, es_filler)
+        talent_ = resolve_talent(i, row, apn, es_filler)
+    with METRICS.timer('conditions.build'):
+        conditions_, entry, job = build_conditions(row.job_id, j_, job_cache)
+    checker = ConditionChecker('talents_' + TENANT_ID, row.talent_id, conditions_,
+                               named_queries=named_queries, cache_entry=entry, source=talent_, local=local)
+    return named_unsatisfied(job, checker.find_unsatisfied_conditions())
+
+
+def check_job(rows, apn, es_filler, resolver=None, job_cache=None, features=False, local=None):
+    """
+    check the rows of the same job, its conditions are built once and evaluated by JobBatchChecker
+    :param rows: [(i, row), ...]
+    :param features: also compute the PAIR_FEATURES of the rows
+    :param local: LocalConditions checking the talent _source in process, None to check with ES
+    :return: [(i, row, unsatisfied conditions), ...], [(i, row, unsatisfied conditions, features), ...] with features,
+             the unsatisfied conditions as Unsatisfied
+    """
+    i0, row0 = rows[0]
+    if resolver:
+        resolver.prefetch([row for _, row in rows])
+        j_ = resolver.get_job(row0.job_id)
+        talents = [resolver.get_talent(row.talent_id) for _, row in rows]
+    else:
+        j_ = resolve_job(i0, row0, apn, es_filler)
+        talents = [resolve_talent(i, row, apn, es_filler) for i, row in rows]
+    # the pair features need the Job whose conditions are checked
+    if features and job_cache is not None:
+        entry = job_cache.get(row0.job_id, j_)
+        job, conditions_ = entry.job, entry.conditions
+    elif features:
+        from lib.datatype.job import Job
+        job, entry = Job(j_), None
+        conditions_ = job.get_required_conditions()
+    else:
+        with METRICS.timer('conditions.build'):
+            conditions_, entry, job = build_conditions(row0.job_id, j_, job_cache)
+    checker = JobBatchChecker('talents_' + TENANT_ID, [row.talent_id for _, row in rows], conditions_,
+                              cache_entry=entry, sources=talents, local=local)
+    _, failures = checker.check()
+    if not features:
+        return [(i, row, named_unsatisfied(job, failures.get(str(row.talent_id)))) for i, row in rows]
+    # the pair features match the failures by the identity of the conditions
+    return [(i, row, named_unsatisfied(job, failures.get(str(row.talent_id))), f_)
+            for (i, row), f_ in zip(rows, pair_features(job, rows, talents, failures))]
+
+
+def pair_features(job, rows, talents, failures):
+    """
+    :param talents: _source of the talents of the rows, None if not found
+    :return: PAIR_FEATURES matrix of the rows, NaN for the missing talents
+    """
+    from datetime import datetime
+    from lib.datatype.talent import Talent
+    from lib.pair_features import PAIR_FEATURES, job_pair_features
+    import numpy as np
+    now = datetime.now()
+    found = [k_ for k_, t_ in enumerate(talents) if t_]
+    features = np.full((len(rows), len(PAIR_FEATURES)), np.nan, dtype=np.float32)
+    # the ids are strings as gotten from ES, an int id 0 would be taken for a missing one
+    found_talents = [Talent({'_id': str(rows[k_][1].talent_id), '_index': 'talents_' + TENANT_ID,
+                             '_source': talents[k_]}, now) for k_ in found]
+    features[found] = job_pair_features(job, found_talents, failures)
+    return features
+
+
+def ordered_map(fn, items, max_in_flight=1):
+    """
+    call fn(item) for every item with at most max_in_flight calls at the same time
+    :return: generator of (item, result), in the input order
+    """
+    if max_in_flight <= 1:
+        for item in items:
+            yield item, fn(item)
+        return
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = deque()
+        for item in items:
+            if len(in_flight) >= max_in_flight:
+                item_, future_ = in_flight.popleft()
+                yield item_, future_.result()
+            in_flight.append((item, executor.submit(fn, item)))
+        while in_flight:
+            item_, future_ = in_flight.popleft()
+            yield item_, future_.result()
+
+
+def harvest(rows, apn, es_filler, max_in_flight=1, resolver=None, named_queries=False, job_cache=None, skip=None,
+            local=None, timings=False):
+    """
+    check the rows with at most max_in_flight rows being processed at the same time
+    :param resolver: DocResolver, the rows must come from its read_ahead
+    :param skip: skip(row) is True for the rows not to be checked, they still count in i
+    :param timings: also yield the {stage: seconds} of every row
+    :return: generator of (i, row, unsatisfied conditions[, stages]), in the input order
+    """
+    def check(item):
+        with METRICS.track() as stages_, METRICS.timer('row'), PROFILER.sampled():
+            cs_ = check_row(*item, apn, es_filler, resolver, named_queries, job_cache, local)
+        return (cs_, stages_) if timings else (cs_,)
+
+    items = ((i, row) for i, row in enumerate(rows, 1) if not (skip and skip(row)))
+    for (i, row), result in ordered_map(check, items, max_in_flight):
+        yield (i, row) + result
+
+
+def harvest_by_job(groups, apn, es_filler, max_in_flight=1, resolver=None, job_cache=None, features=False,
+                   local=None, timings=False):
+    """
+    check the rows job by job, ES queries scale with the distinct jobs instead of the rows
+    :param groups: iterable of (job_id, [(i, row), ...]), see CheckedData.fetch_by_job
+    :param max_in_flight: maximum number of jobs being processed at the same time
+    :param features: also yield the PAIR_FEATURES of every row
+    :param timings: also yield the {stage: seconds} of the job with every of its rows
+    :return: generator of (i, row, unsatisfied conditions[, features][, stages]), grouped by job
+    """
+    def check(group):
+        with METRICS.track() as stages_, METRICS.timer('job'), PROFILER.sampled():
+            results = check_job(group[1], apn, es_filler, resolver, job_cache, features, local)
+        return [r_ + (stages_,) for r_ in results] if timings else results
+
+    for _, results in ordered_map(check, groups, max_in_flight):
+        yield from results
+
+
+def create_evaluator(mapping_file=None):
+    """
+    :param mapping_file: JSON mapping of the talent index, e.g. saved from GET talents_10/_mapping,
+                         without it the field types are guessed from the values
+    """
+    from lib.condition_evaluator import ConditionEvaluator, flatten_mapping, opaque_fields
+    if not mapping_file:
+        logger.warning("No talent mapping: a term matches the analysed tokens of a text field, case-insensitively, "
+                       "and the copy_to targets and custom analyzers are unknown")
+        return ConditionEvaluator()
+    with open(mapping_file, encoding='utf-8') as f_:
+        mapping = json.load(f_)
+    # either the response of _mapping, {index: {"mappings": {...}}}, or the mapping itself
+    if 'mappings' not in mapping and 'properties' not in mapping and len(mapping) == 1:
+        mapping, = mapping.values()
+    properties = mapping.get('mappings', mapping).get('properties', {})
+    return ConditionEvaluator(flatten_mapping(properties), opaque_fields(properties))
+
+
+class Unsatisfied:
+    """
+    an unsatisfied condition as the results are logged and recorded with, picklable to come back from a worker process
+    """
+    __slots__ = ('name', 'ui_json')
+
+    def __init__(self, condition, name=None):
+        """
+        :param name: of the required condition in CONDITION_NAMES, e.g. 'skill', the type of condition if None
+        """
+        self.name = name or type(condition).__name__
+        self.ui_json = condition.ui_json
+
+
+def outcome(cs_):
+    return f"failed:{','.join(c_.name for c_ in cs_)}" if cs_ else 'passed'
+
+
+def log_result(i, row, cs_):
+    # called for every row, the messages are only built when their level is enabled
+    if cs_:
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning("%s - job %s(%s) - talent %s(%s). Job requirements are not satisfied:\n%s\n",
+                           i, row.job_id, row.job_duty, row.talent_id, row.talent_duty, [c_.ui_json for c_ in cs_])
+        # pp.pprint(job_filled)
+        # pp.pprint(talent_filled)
+        # break
+    else:
+        logger.info("%s - job %s(%s) - talent %s(%s) has passed check.",
+                    i, row.job_id, row.job_duty, row.talent_id, row.talent_duty)
+
+
+def create_clients(args):
+    """
+    :return: the connectors, caches and checkers of a harvest, each worker process creates its own
+    """
+    apn_cache = APNCache(args.apn_cache, ttl=args.apn_cache_ttl * 3600, max_bytes=args.apn_cache_mb * 1024 * 1024) \
+        if args.apn_cache else None
+    pool_size = max(args.pool_size, args.concurrency)
+    apn = APN(host='https://api.hitalentech.com', refresh_token=args.refresh_token, cache=apn_cache,
+              pool_size=pool_size, retries=args.retries, backoff_factor=args.backoff)
+    es_filler = ESFiller(pool_size=pool_size, retries=args.retries, backoff_factor=args.backoff)
+    resolver = DocResolver(TARGET_ES, apn, es_filler, TENANT_ID) if args.mget_window > 0 else None
+    job_cache = JobCache(max_entries=args.job_cache, max_bytes=args.job_cache_mb * 1024 * 1024) \
+        if args.job_cache > 0 else None
+    local = None
+    if args.local_conditions or args.parity:
+        local = LocalConditions(create_evaluator(args.talent_mapping), parity=args.parity)
+    return SimpleNamespace(apn_cache=apn_cache, apn=apn, es_filler=es_filler, resolver=resolver,
+                           job_cache=job_cache, local=local)
+
+
+def close_clients(clients):
+    """
+    log the stats of the clients, merge those of the caches into METRICS and close them
+    """
+    if clients.job_cache:
+        logger.info(f"Job cache: {clients.job_cache.stats}")
+        METRICS.merge('job_cache', clients.job_cache.stats)
+    logger.info(f"APN endpoints: {clients.apn.stats.summary()}")
+    logger.info(f"ESFiller endpoints: {clients.es_filler.stats.summary()}")
+    if clients.apn_cache:
+        logger.info(f"APN cache: {clients.apn_cache.stats}")
+        METRICS.merge('apn_cache', clients.apn_cache.stats)
+        clients.apn_cache.close()
+
+
+def check_items(items, clients, args, skip=None, features=False, timings=False):
+    """
+    :param items: groups of (job_id, [(i, row), ...]) with --group_by_job, rows otherwise
+    :param skip: see harvest, the groups are already skipped by CheckedData.fetch_by_job
+    :return: generator of (i, row, unsatisfied conditions[, features][, stages])
+    """
+    if args.group_by_job:
+        return harvest_by_job(items, clients.apn, clients.es_filler, max_in_flight=args.concurrency,
+                              resolver=clients.resolver, job_cache=clients.job_cache, features=features,
+                              local=clients.local, timings=timings)
+    if clients.resolver:
+        items = clients.resolver.read_ahead(items, window=args.mget_window, skip=skip)
+    return harvest(items, clients.apn, clients.es_filler, max_in_flight=args.concurrency, resolver=clients.resolver,
+                   named_queries=args.named_queries, job_cache=clients.job_cache, skip=skip, local=clients.local,
+                   timings=timings)
+
+
+def shard_of(job_id, workers):
+    return zlib.crc32(str(job_id).encode()) % workers
+
+
+def shard_row(i, row):
+    """
+    :return: picklable copy of a row (pandas itertuples are not) which keeps its number i in the whole input
+    """
+    return SimpleNamespace(i=i, **row._asdict())
+
+
+def harvest_sharded(checked_data, args, skip=None, features=False, timings=False):
+    """
+    check the rows in args.workers forked processes, the rows of a job all go to the same worker so that
+    its job cache and prefetched docs stay local; the results and the log records come back to this process
+    :return: generator of (i, row, unsatisfied conditions[, features][, stages]), in the order of the serial harvest
+    """
+    import multiprocessing
+    context = multiprocessing.get_context('fork')
+    tasks = [context.Queue(maxsize=args.shard_queue) for _ in range(args.workers)]
+    results = context.Queue(maxsize=args.shard_queue * args.workers)
+    logs = context.Queue()
+    log.listen(logs)
+    workers = [context.Process(target=harvest_worker, args=(k_, tasks[k_], results, logs, args), daemon=True)
+               for k_ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    # numbers of the rows in the order they are yielded, and the rows themselves until then
+    expected, rows, failed = deque(), {}, []
+
+    def feed():
+        try:
+            if args.group_by_job:
+                for job_id, group in checked_data.fetch_by_job(skip=skip):
+                    for i, row in group:
+                        rows[i] = row
+                        expected.append(i)
+                    tasks[shard_of(job_id, args.workers)].put((job_id, [(i, shard_row(i, row)) for i, row in group]))
+            else:
+                for i, row in enumerate(checked_data.fetch(), 1):
+                    if skip and skip(row):
+                        continue
+                    rows[i] = row
+                    expected.append(i)
+                    tasks[shard_of(row.job_id, args.workers)].put(shard_row(i, row))
+        except Exception as e_:
+            failed.append(e_)
+        finally:
+            for task in tasks:
+                task.put(None)
+
+    feeder = threading.Thread(target=feed, name='harvest-feeder', daemon=True)
+    feeder.start()
+    buffered, running = {}, args.workers
+    try:
+        while running:
             try:
-                talent_filled = es_filler.fill_talent(talent_apn_json, row.talent_id)
-            except Exception as e:
-                pp.pprint(talent_apn_json)
-                raise e
-            time.sleep(1)
-        conditions_ = Job(j_).get_required_conditions()
-        checker = ConditionChecker('talents_' + TENANT_ID, row.talent_id, conditions_)
-        if cs_ := checker.find_unsatisfied_conditions():
-            logger.warning(
-                f"{i} - job {row.job_id}({row.job_duty}) - talent {row.talent_id}({row.talent_duty}). "
-                f"Job requirements are not satisfied:\n"
-                f"{[c_.ui_json for c_ in cs_]}\n")
-            # pp.pprint(job_filled)
-            # pp.pprint(talent_filled)
-            # break
-        else:
-            logger.info(f"{i} - job {row.job_id}({row.job_duty}) - talent {row.talent_id}({row.talent_duty}) has passed check.")
+                kind, *message = results.get(timeout=1)
+            except queue.Empty:
+                if dead := [k_ for k_, w_ in enumerate(workers) if w_.exitcode not in (None, 0)]:
+                    raise RuntimeError(f"Harvest workers {dead} exited")
+                continue
+            if kind == 'row':
+                buffered[message[0]] = message[1:]
+            elif kind == 'done':
+                running -= 1
+                METRICS.absorb(message[1])
+            else:
+                raise RuntimeError(f"Harvest worker {message[0]} failed:\n{message[1]}")
+            while expected and expected[0] in buffered:
+                i = expected.popleft()
+                cs_, features_, stages_ = buffered.pop(i)
+                yield (i, rows.pop(i), cs_) + ((features_,) if features else ()) + ((stages_,) if timings else ())
+        feeder.join()
+        if failed:
+            raise failed[0]
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+
+def harvest_worker(k, tasks, results, logs, args):
+    """
+    worker k of harvest_sharded, checks the items of its tasks queue until None
+    with its own ES and connector clients, those of the main process are not used after the fork
+    """
+    TARGET_ES.reset()
+    log.forward(logs)
+    METRICS.reset()
+    PROFILER.configure(args.profile, path=f"{args.profile_output}.{k}", sample=args.profile_sample,
+                       top=args.profile_top)
+    try:
+        clients = create_clients(args)
+        with PROFILER.loop():
+            features = bool(args.features)
+            for _, row, cs_, *extra_ in check_items(iter(tasks.get, None), clients, args, features=features,
+                                                    timings=True):
+                results.put(('row', row.i, cs_, extra_[0] if features else None, extra_[-1]))
+        close_clients(clients)
+        results.put(('done', k, METRICS.snapshot()))
+    except Exception:
+        results.put(('error', k, traceback.format_exc()))
+
+
+def main():
+    if args.workers > 1:
+        # the records of the workers are written by this process
+        args.log_queue = True
+    log.configure(log.parse_levels(args.log_level), use_queue=args.log_queue)
+    METRICS.report_interval = args.metrics_interval
+    METRICS.reset()
+    PROFILER.configure(args.profile, path=args.profile_output, sample=args.profile_sample, top=args.profile_top)
+    checked_data = CheckedData(args.data, chunksize=args.chunksize)
+    journal, skip = None, None
+    if args.journal:
+        journal = ProgressJournal(args.journal, batch_size=args.journal_batch, resume=args.resume)
+        if args.resume:
+            skip = lambda row: journal.done(row.talent_id, row.job_id)
+    feature_writer = None
+    if args.features:
+        from lib.pair_features import PairFeatureWriter
+        feature_writer = PairFeatureWriter(args.features, resume=args.resume)
+    sink = None
+    if args.output:
+        from lib.result_sink import ResultSink
+        sink = ResultSink(args.output, buffer_rows=args.output_buffer, resume=args.resume)
+    clients = None
+    if args.workers > 1:
+        results = harvest_sharded(checked_data, args, skip=skip, features=feature_writer is not None,
+                                  timings=sink is not None)
+    else:
+        clients = create_clients(args)
+        items = checked_data.fetch_by_job(skip=skip) if args.group_by_job else checked_data.fetch()
+        results = check_items(items, clients, args, skip=skip, features=feature_writer is not None,
+                              timings=sink is not None)
+    try:
+        with PROFILER.loop():
+            for i, row, cs_, *extra_ in results:
+                METRICS.row()
+                log_result(i, row, cs_)
+                if journal is not None:
+                    journal.record(row.talent_id, row.job_id, outcome(cs_))
+                if feature_writer is not None:
+                    feature_writer.append(i, row.talent_id, row.job_id, extra_[0])
+                if sink is not None:
+                    sink.append(i, row, [c_.name for c_ in cs_ or ()], extra_[-1])
+    finally:
+        if journal is not None:
+            journal.close()
+        if feature_writer is not None:
+            feature_writer.close()
+        if sink is not None:
+            sink.close()
+    if clients is not None:
+        close_clients(clients)
+    logger.info(f"Stages: {json.dumps(METRICS.summary())}")
+    if sink is not None and sink.rows:
+        from lib.result_sink import failure_summary
+        summary = failure_summary(args.output)
+        summary.to_csv(args.output + '.summary.csv')
+        logger.info(f"Failures per condition type of {sink.rows} pairs:\n{summary.to_string()}")
+    if args.metrics:
+        METRICS.write(args.metrics)
     # server, db = args.input.split('/')
     # fetcher = MariaDBFetcher(server=server, user=args.username, password=args.password, db=db)
     # for sample in fetcher.fetch(skip=0):
@@ -123,7 +832,10 @@ def main():
     #     break
 
 
-if __name__ == '__main__':
+def parse_args(argv=None):
+    """
+    :param argv: the command line arguments, None for sys.argv
+    """
     parser = argparse.ArgumentParser(description='ESfill the elasticsearch data.\n'
                                                  'python3 scripts/talents_esfill_cloud.py '
                                                  '-i localhost:3306/apn -u ? -p ?')
@@ -131,7 +843,92 @@ if __name__ == '__main__':
     parser.add_argument("-u", f"--username", type=str, help=f'output_index: the target ES index;')
     parser.add_argument("-p", f"--password", type=str)
     parser.add_argument("-rt", "--refresh_token", type=str, help='refresh token;')
-    args = parser.parse_args()
+    parser.add_argument("-d", "--data", type=str, default='data/训练数据修正 - application_202005251554.csv',
+                        help='checked applications, csv or parquet/arrow;')
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help='stream the data by chunks of this many rows instead of loading it at once, '
+                             'with --group_by_job the rows are grouped per chunk;')
+    parser.add_argument("-c", "--concurrency", type=int, default=1,
+                        help='maximum number of rows being fetched/filled/checked at the same time;')
+    parser.add_argument("-w", "--mget_window", type=int, default=0,
+                        help='resolve the jobs and talents of this many rows with one mget per index, 0 to disable;')
+    parser.add_argument("--workers", type=int, default=1,
+                        help='processes checking the rows, sharded by job; with --profile, one report per worker;')
+    parser.add_argument("--shard_queue", type=int, default=1000,
+                        help='rows (jobs with --group_by_job) queued per worker;')
+    parser.add_argument("-nq", "--named_queries", action='store_true',
+                        help='diagnose the unsatisfied conditions of a row with one search of named queries;')
+    parser.add_argument("-g", "--group_by_job", action='store_true',
+                        help='check all the talents of a job with one search, '
+                             'the concurrency is then the number of jobs in flight;')
+    parser.add_argument("-f", "--features", type=str, default=None,
+                        help='write the pair features of the rows to this float32 matrix file, '
+                             'e.g. data/pair_features.f32, requires --group_by_job, appended to with --resume;')
+    parser.add_argument("-lc", "--local_conditions", action='store_true',
+                        help='check the conditions on the talent docs in process, ES only for the queries '
+                             'the evaluator cannot tell;')
+    parser.add_argument("--parity", action='store_true',
+                        help='check the conditions both in process and with ES, log the verdicts which differ;')
+    parser.add_argument("--talent_mapping", type=str, default=None,
+                        help='JSON mapping of the talent index for the in process check, e.g. saved from '
+                             'GET talents_10/_mapping, required by --local_conditions without --parity;')
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help='one record per pair to this .parquet or .csv file, a .csv is appended to with --resume '
+                             '(a .parquet file cannot be resumed), '
+                             'and the failure rates per condition type to OUTPUT.summary.csv;')
+    parser.add_argument("--output_buffer", type=int, default=10000,
+                        help='records per Parquet row group or CSV write;')
+    parser.add_argument("-jc", "--job_cache", type=int, default=1000,
+                        help='number of built jobs and their compiled conditions kept in memory, 0 to disable;')
+    parser.add_argument("--job_cache_mb", type=int, default=256, help='memory limit of the job cache in MB;')
+    parser.add_argument("-ac", "--apn_cache", type=str, default=None,
+                        help='sqlite file keeping the APN talents and jobs between runs, e.g. data/apn_cache.db;')
+    parser.add_argument("--apn_cache_ttl", type=float, default=24 * 7,
+                        help='hours before a cached APN payload is fetched again;')
+    parser.add_argument("--apn_cache_mb", type=int, default=2048, help='size limit of the APN cache in MB;')
+    parser.add_argument("-j", "--journal", type=str, default=None,
+                        help='file recording the checked (talent_id, job_id) pairs, e.g. data/harvest.journal;')
+    parser.add_argument("--resume", action='store_true', help='skip the pairs already recorded in the journal;')
+    parser.add_argument("--journal_batch", type=int, default=1000, help='records written to the journal at once;')
+    parser.add_argument("--pool_size", type=int, default=10,
+                        help='keep-alive connections per host of APN and ESFiller, at least the concurrency;')
+    parser.add_argument("--retries", type=int, default=3,
+                        help='retries of APN and ESFiller requests on 5xx and connection resets;')
+    parser.add_argument("--backoff", type=float, default=0.5, help='exponential backoff factor of the retries;')
+    parser.add_argument("-l", "--log_level", type=str, nargs='*', default=[],
+                        help='LEVEL for all modules and/or module=LEVEL per module prefix, '
+                             'e.g. INFO lib.datatype=WARNING;')
+    parser.add_argument("--log_queue", action='store_true',
+                        help='write the logs from a background thread instead of the checking threads;')
+    parser.add_argument("-m", "--metrics", type=str, default=None,
+                        help='write the stage timings and counters to this path .json and .prom, e.g. data/harvest;')
+    parser.add_argument("--metrics_interval", type=float, default=60,
+                        help='seconds between two rows/sec lines;')
+    parser.add_argument("--profile", choices=('cpu', 'mem'), default=None,
+                        help='cProfile the checks, or trace the allocations of the loop with tracemalloc;')
+    parser.add_argument("--profile_output", type=str, default='profile',
+                        help='prefix of the profile reports, e.g. data/profile for .pstats and .txt;')
+    parser.add_argument("--profile_sample", type=float, default=1.0,
+                        help='fraction of the rows (jobs with --group_by_job) profiled by --profile cpu, '
+                             'the whole loop is profiled from Python 3.12;')
+    parser.add_argument("--profile_top", type=int, default=25, help='functions or allocation sites listed;')
+    args_ = parser.parse_args(argv)
+    if args_.features and not args_.group_by_job:
+        parser.error('--features requires --group_by_job')
+    if args_.resume and not args_.journal:
+        # the pairs to skip are those of the journal
+        parser.error('--resume requires --journal')
+    if args_.resume and args_.output and not args_.output.lower().endswith('.csv'):
+        # a Parquet file is written anew, the records of the pairs skipped by the journal would be lost
+        parser.error('--resume requires a .csv --output')
+    if args_.local_conditions and not args_.parity and not args_.talent_mapping:
+        # the verdicts would not be checked against ES while the field types are guessed
+        parser.error('--local_conditions requires --talent_mapping, or --parity')
+    return args_
+
+
+if __name__ == '__main__':
+    args = parse_args()
     main()
     # pp.pprint(cond_.es_condition)
     # pp.pprint(cond_.invalid_fields)
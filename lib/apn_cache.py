@@ -0,0 +1,92 @@
+import json
+import time
+import sqlite3
+import threading
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+
+
+class APNCache:
+    """
+    on-disk store of the formatted APN payloads by (kind, id), e.g. ('talent', '123')
+    entries older than ttl seconds are revalidated against APN, the stale one is served if APN fails
+    the oldest entries are dropped once the payloads exceed max_bytes
+    """
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=2 * 1024 ** 3):
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS payloads ("
+                           "kind TEXT NOT NULL, id TEXT NOT NULL, payload TEXT NOT NULL, "
+                           "fetched_at REAL NOT NULL, size INTEGER NOT NULL, PRIMARY KEY (kind, id))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS payloads_fetched_at ON payloads (fetched_at)")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM payloads").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'stale': 0, 'evictions': 0}
+
+    def get(self, kind, id_):
+        """
+        :return: (payload, fetched_at), (None, None) if not stored
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT payload, fetched_at FROM payloads WHERE kind = ? AND id = ?",
+                                     (kind, str(id_))).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def put(self, kind, id_, payload):
+        text = json.dumps(payload, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM payloads WHERE kind = ? AND id = ?",
+                                     (kind, str(id_))).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO payloads (kind, id, payload, fetched_at, size) "
+                               "VALUES (?, ?, ?, ?, ?)", (kind, str(id_), text, time.time(), size))
+            self._bytes += size - (old[0] if old else 0)
+            self.__evict()
+
+    def __evict(self):
+        while self._bytes > self._max_bytes:
+            # drop the oldest tenth at a time, an eviction per put would cost a scan each
+            n = max(1, self._conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0] // 10)
+            rows = self._conn.execute("SELECT kind, id, size FROM payloads ORDER BY fetched_at LIMIT ?",
+                                      (n,)).fetchall()
+            if not rows:
+                self._bytes = 0
+                return
+            self._conn.executemany("DELETE FROM payloads WHERE kind = ? AND id = ?", [r_[:2] for r_ in rows])
+            self._bytes -= sum(r_[2] for r_ in rows)
+            self.stats['evictions'] += len(rows)
+
+    def __count(self, stat):
+        # the stats are updated by the checking threads, += is not atomic
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_or_fetch(self, kind, id_, fetch):
+        """
+        :param fetch: gets the payload from APN on miss or expiry
+        """
+        payload, fetched_at = self.get(kind, id_)
+        if payload is not None and time.time() - fetched_at < self._ttl:
+            self.__count('hits')
+            return payload
+        self.__count('misses' if payload is None else 'revalidations')
+        try:
+            fresh = fetch()
+        except Exception as e:
+            if payload is None:
+                raise e
+            self.__count('stale')
+            logger.warning(f"Serving stale {kind} {id_} fetched at {time.ctime(fetched_at)}: {e}")
+            return payload
+        if fresh is not None:
+            self.put(kind, id_, fresh)
+        return fresh
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,44 +1,212 @@
 import os
-from libsearcher import ConditionsCollection, Operator
+from collections import Counter
+from libsearcher import TalentConditions, Operator
 from libsearcher.location import LocationSearcher, SearchMode
 from libsearcher.pylibshared.datatype import LocationInfo, OfficialLocationInfo
 from libsearcher.pylibshared.utils.string_utils import list_in_list
 from libsearcher.pylibshared.utils.elastic import ESClient
-from libsearcher.pylibshared.utils.logger import get_logger
-logger = get_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
-target_es = ESClient(hosts=os.environ.get('ELASTIC_HOSTS', 'localhost'), timeout=120)
+from lib.lazy import Lazy, lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+ELASTIC_HOSTS = os.environ.get('ELASTIC_HOSTS', 'localhost')
+target_es = Lazy(lambda: ESClient(hosts=ELASTIC_HOSTS, timeout=120))
 TALENT_INDEX = 'talents_recommendation'
+RECOMMEND_TALENT_ID = "recommend_talent"
+JOB_QUERY_INDEX = 'jobs_percolator'
+PERCOLATE_BATCH_SIZE = 100
+
+
+def create_index_client():
+    # the index management and the percolate queries are not wrapped by ESClient
+    from elasticsearch import Elasticsearch
+    return Elasticsearch(hosts=ELASTIC_HOSTS, timeout=120)
+
+
+index_es = Lazy(create_index_client)
+
+
+def country_condition(job_source):
+    """
+    :return: the talent prefers one of the countries of the job, None if the job has no country
+    """
+    country_searchers = []
+    for job_location in job_source.get('locations', []):
+        if country := job_location.get('officialCountry', None):
+            loc = LocationInfo(official_loc=OfficialLocationInfo(country=country))
+        elif country := job_location.get('country', None):
+            loc = LocationInfo(country=country)
+        else:
+            continue
+        country_searchers.append(LocationSearcher(search_mode=SearchMode.PREFERRED, location_info=loc))
+    if not country_searchers:
+        return None
+    return TalentConditions(conditions=country_searchers, operator=Operator.should)
+
+
+def job_conditions(job):
+    """
+    :param job: raw object gotten from Elastic get and search APIs
+    :return: TalentConditions of the required conditions of the job, the locations without country are left out
+    """
+    from lib.datatype.job import Job
+    conditions = dict(Job(job).required_conditions, location=country_condition(job['_source']))
+    return TalentConditions(conditions=list(filter(None, conditions.values())), operator=Operator.must)
 
 
 class ApplicationChecker:
+    """
+    checks one talent against one job by indexing the talent under RECOMMEND_TALENT_ID,
+    see JobPercolator to check many talents against many jobs
+    """
     def __init__(self, talent, job):
+        """
+        :param talent: _source of the talent
+        :param job: raw object gotten from Elastic get and search APIs
+        """
         self._talent = talent
         self._job = job
-        target_es.push_doc(index_=TALENT_INDEX, doc_=talent, id_="recommend_talent")
-        country_searchers = []
-        for job_location in self._job['locations']:
-            if country := job_location.get('officialCountry', None):
-                loc = LocationInfo(OfficialLocationInfo(country=country))
-            elif country := job_location.get('country', None):
-                loc = LocationInfo(country=country)
-            else:
-                continue
-            country_searchers.append(loc)
-        country_condition = ConditionsCollection(operator=Operator.should,
-                                                 conditions=[LocationSearcher(search_mode=SearchMode.PREFERRED, )])
+        target_es.push_doc(index_=TALENT_INDEX, doc_=talent, id_=RECOMMEND_TALENT_ID)
+        self._conditions = job_conditions(job)
 
     def check(self):
+        """
+        :return: whether the talent satisfies the required conditions of the job
+        """
+        query = {"bool": {"filter": [{"ids": {"values": [RECOMMEND_TALENT_ID]}}],
+                          "must": [self._conditions.es_condition]}}
+        return bool(target_es.count(index=TALENT_INDEX, body={"query": query}))
+
+
+class JobPercolator:
+    """
+    the required conditions of the jobs stored once as percolator queries, the talents are percolated in batches:
+    one search tells every job matched by every talent of a batch, the talents are not indexed
+    """
+    def __init__(self, index_=JOB_QUERY_INDEX, talent_index=TALENT_INDEX):
+        """
+        :param index_: index of the job queries
+        :param talent_index: index whose mapping and analysis the percolated talents are parsed with
+        """
+        self._index = index_
+        self._talent_index = talent_index
+
+    def create_index(self, recreate=False):
+        """
+        create the index of the job queries with the mapping of the talent index, plus the percolator field
+        """
+        if index_es.indices.exists(index=self._index):
+            if not recreate:
+                return
+            index_es.indices.delete(index=self._index)
+        mapping, = index_es.indices.get_mapping(index=self._talent_index).values()
+        settings, = index_es.indices.get_settings(index=self._talent_index).values()
+        properties = dict(mapping['mappings'].get('properties', {}),
+                          query={'type': 'percolator'}, jobId={'type': 'keyword'})
+        body = {"mappings": {"properties": properties}}
+        if analysis := settings['settings']['index'].get('analysis'):
+            body["settings"] = {"analysis": analysis}
+        index_es.indices.create(index=self._index, body=body)
+        logger.info(f"Created {self._index} with the mapping of {self._talent_index}")
+
+    def register(self, jobs):
+        """
+        :param jobs: raw objects gotten from Elastic get and search APIs, a registered job is replaced
+        :return: ids of the registered jobs, those whose conditions ES rejects are logged and left out
+        """
+        from elasticsearch.helpers import bulk
+        actions, ids = [], []
+        for job in jobs:
+            ids.append(id_ := str(job['_id']))
+            actions.append({"_index": self._index, "_id": id_,
+                            "_source": {"query": job_conditions(job).es_condition, "jobId": id_}})
+        _, errors = bulk(index_es, actions, raise_on_error=False, refresh=True)
+        rejected = set()
+        for error in errors:
+            rejected.add(error['index']['_id'])
+            logger.warning(f"Job {error['index']['_id']} not registered: {error['index'].get('error')}")
+        return [id_ for id_ in ids if id_ not in rejected]
+
+    def unregister(self, job_ids):
+        from elasticsearch.helpers import bulk
+        bulk(index_es, ({"_op_type": "delete", "_index": self._index, "_id": str(id_)} for id_ in job_ids),
+             raise_on_error=False, refresh=True)
+
+    def match(self, talents, batch_size=PERCOLATE_BATCH_SIZE):
+        """
+        :param talents: _source of the talents
+        :return: [ids of the jobs whose conditions the talent satisfies, ...] along talents
+        """
+        from elasticsearch.helpers import scan
+        matched = [set() for _ in talents]
+        for start in range(0, len(talents), batch_size):
+            body = {"query": {"percolate": {"field": "query", "documents": talents[start:start + batch_size]}},
+                    "_source": False}
+            for hit_ in scan(index_es, query=body, index=self._index):
+                # the slots are the positions of the matched talents in the batch
+                for slot_ in hit_.get('fields', {}).get('_percolator_document_slot', [0]):
+                    matched[start + slot_].add(hit_['_id'])
+        return matched
+
+
+class PhraseMatcher:
+    """
+    the phrases of lb split into words once, with an inverted index word -> phrases, so that a phrase of la is only
+    checked by list_in_list against the phrases sharing enough words with it
+    """
+    def __init__(self, lb, minimum_should_match='2'):
+        self._lb = list(lb)
+        self._minimum_should_match = minimum_should_match
+        self._words = [b.split(' ') for b in self._lb]
+        # word -> [(position of the phrase, occurrences of the word in it), ...]
+        self._index = {}
+        for k_, sb in enumerate(self._words):
+            for word, n_ in Counter(sb).items():
+                self._index.setdefault(word, []).append((k_, n_))
+
+    def __threshold(self, sa, sb):
+        """
+        :return: shared words a pair needs to be checked, it never prunes a pair list_in_list could match
+        """
+        if not (msm := str(self._minimum_should_match)).isdigit():
+            # percentages and negative numbers: any shared word
+            return 1
+        return max(1, min(int(msm), len(sa), len(sb)))
+
+    def candidates(self, sa):
+        """
+        :return: positions in lb of the phrases which may match the words sa, in the order of lb
+        """
+        shared_a, shared_b = Counter(), Counter()
+        for word, n_ in Counter(sa).items():
+            for k_, m_ in self._index.get(word, ()):
+                shared_a[k_] += n_
+                shared_b[k_] += m_
+        return sorted(k_ for k_ in shared_a
+                      if max(shared_a[k_], shared_b[k_]) >= self.__threshold(sa, self._words[k_]))
+
+    def matches(self, a):
+        """
+        :return: generator of the phrases of lb matching a, in the order of lb
+        """
+        sa = a.split(' ')
+        for k_ in self.candidates(sa):
+            if list_in_list(sa, self._words[k_], minimum_should_match=self._minimum_should_match):
+                yield self._lb[k_]
 
+    def match_all(self, la):
+        """
+        :return: [(a, b), ...] of all the matched pairs, in the order of la then lb
+        """
+        return [(a, b) for a in la for b in self.matches(a)]
 
 
 def compare_lists(la, lb, get_all=False):
-    all_matched = []
+    """
+    :return: the first matched (a, b), [] if none, all the matched pairs with get_all
+    """
+    matcher = PhraseMatcher(lb, minimum_should_match='2')
+    if get_all:
+        return matcher.match_all(la)
     for a in la:
-        if sa := a.split(' '):
-            for b in lb:
-                if (sb := b.split(' ')) and list_in_list(sa, sb, minimum_should_match='2'):
-                    if not get_all:
-                        return a, b
-                    else:
-                        all_matched.append((a, b))
-    return all_matched
+        for b in matcher.matches(a):
+            return a, b
+    return []
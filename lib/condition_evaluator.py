@@ -0,0 +1,347 @@
+import re
+from functools import lru_cache
+from datetime import datetime, timedelta
+TOKEN_REGEX = re.compile(r'\w+')
+DATE_MATH_REGEX = re.compile(r'^now(?:([+-])(\d+)([yMwdhm]))?(?:/[yMwdhm])?$')
+DATE_MATH_UNITS = {'y': 365.25, 'M': 30.44, 'w': 7, 'd': 1, 'h': 1 / 24, 'm': 1 / 1440}
+TEXT, KEYWORD = 'text', 'keyword'
+
+
+class UnsupportedQuery(Exception):
+    """
+    a query the evaluator cannot tell, to be left to ES
+    """
+
+
+def analyze(text):
+    """
+    approximation of the ES standard analyzer: lowercase word tokens
+    """
+    return TOKEN_REGEX.findall(str(text).lower())
+
+
+def flatten_mapping(properties, prefix=''):
+    """
+    :param properties: "properties" of an index mapping as returned by ES, e.g. GET talents_10/_mapping
+    :return: {field path: type}, sub-fields included, e.g. {'title': 'text', 'title.keyword': 'keyword'}
+    """
+    types = {}
+    for name, field in properties.items():
+        path = prefix + name
+        if 'type' in field:
+            types[path] = field['type']
+        types.update(flatten_mapping(field.get('properties', {}), path + '.'))
+        types.update(flatten_mapping(field.get('fields', {}), path + '.'))
+    return types
+
+
+def opaque_fields(properties, prefix=''):
+    """
+    :param properties: "properties" of an index mapping, see flatten_mapping
+    :return: {field path} whose indexed terms cannot be told from the _source: copy_to targets, fields with
+             a custom analyzer or normalizer, and the sub-fields but an un-normalized keyword one
+    """
+    opaque = set()
+    for name, field in properties.items():
+        path = prefix + name
+        if field.get('analyzer', 'standard') != 'standard' or field.get('search_analyzer', 'standard') != 'standard' \
+                or field.get('normalizer'):
+            opaque.add(path)
+        opaque.update(as_list(field.get('copy_to')))
+        opaque.update(opaque_fields(field.get('properties', {}), path + '.'))
+        for sub_name, sub_field in field.get('fields', {}).items():
+            if sub_name != KEYWORD or sub_field.get('type') != KEYWORD:
+                opaque.add(f"{path}.{sub_name}")
+        opaque.update(opaque_fields(field.get('fields', {}), path + '.'))
+    return opaque
+
+
+def resolve(obj, path):
+    """
+    :return: the values at the dotted path, the lists on the way are flattened like ES does
+    """
+    values = [obj]
+    for key in path.split('.'):
+        next_ = []
+        for v_ in values:
+            if isinstance(v_, dict) and (child := v_.get(key)) is not None:
+                if isinstance(child, list):
+                    next_.extend(c_ for c_ in child if c_ is not None)
+                else:
+                    next_.append(child)
+        values = next_
+    return values
+
+
+class ConditionEvaluator:
+    """
+    evaluates the ES query DSL compiled from the libsearcher conditions against a talent _source in process,
+    raises UnsupportedQuery for the queries it cannot tell, which are then left to ES
+    text fields are matched with an approximation of the standard analyzer, hence the parity mode of the checkers
+    """
+    def __init__(self, mapping=None, opaque=None):
+        """
+        :param mapping: {field path: type}, see flatten_mapping; without it a term matches the exact value
+                        or one of its tokens, i.e. both keyword and text fields
+        :param opaque: {field path} whose queries are left to ES, see opaque_fields
+        """
+        self._types = mapping or {}
+        self._opaque = frozenset(opaque or ())
+        self._queries = {
+            'bool': self.__bool, 'term': self.__term, 'terms': self.__terms, 'match': self.__match,
+            'match_phrase': self.__match_phrase, 'range': self.__range, 'exists': self.__exists, 'ids': self.__ids,
+            'nested': self.__nested, 'match_all': lambda q_, s_: True, 'match_none': lambda q_, s_: False,
+            'constant_score': lambda q_, s_: self.matches(q_['filter'], s_),
+            'dis_max': lambda q_, s_: any(self.matches(q__, s_) for q__ in q_['queries']),
+            'prefix': self.__prefix,
+        }
+
+    def matches(self, query, scope):
+        """
+        :param query: ES query DSL, e.g. TalentConditions(...).es_condition
+        :param scope: Scope of the talent
+        :return: whether the talent is a hit of the query
+        """
+        if len(query) != 1:
+            raise UnsupportedQuery(f"Ambiguous query {list(query)}")
+        (kind, body), = query.items()
+        if (evaluate := self._queries.get(kind)) is None:
+            raise UnsupportedQuery(f"Unsupported query {kind}")
+        return evaluate(body, scope)
+
+    def matched_names(self, queries, scope):
+        """
+        :param queries: named queries, e.g. from data_harvester.named_conditions
+        :return: the names of the matched ones, as ES reports them in matched_queries
+        """
+        return {q_['bool']['_name'] for q_ in queries if self.matches(q_, scope)}
+
+    def field_type(self, field):
+        if (type_ := self._types.get(field)) is not None:
+            return type_
+        return KEYWORD if field.endswith('.keyword') else None
+
+    def __check_field(self, field):
+        if field in self._opaque:
+            raise UnsupportedQuery(f"Field {field} is not indexed as in the _source")
+        return field
+
+    def __field_query(self, body):
+        """
+        :return: (field, parameters) of a single field query, e.g. {"title": {"query": "x"}} or {"title": "x"}
+        """
+        fields = [(k_, v_) for k_, v_ in body.items() if k_ not in ('boost', '_name')]
+        if len(fields) != 1:
+            raise UnsupportedQuery(f"Multi-field query {body}")
+        self.__check_field(fields[0][0])
+        return fields[0]
+
+    def __bool(self, body, scope):
+        for key in ('must', 'filter'):
+            if not all(self.matches(q_, scope) for q_ in as_list(body.get(key))):
+                return False
+        if any(self.matches(q_, scope) for q_ in as_list(body.get('must_not'))):
+            return False
+        if not (should := as_list(body.get('should'))):
+            return True
+        if (msm := body.get('minimum_should_match')) is None:
+            # should clauses only filter when there is no must/filter clause
+            msm = 0 if body.get('must') or body.get('filter') else 1
+        return sum(self.matches(q_, scope) for q_ in should) >= minimum_should_match(msm, len(should))
+
+    def __term(self, body, scope):
+        field, value = self.__field_query(body)
+        if isinstance(value, dict):
+            if value.get('case_insensitive'):
+                raise UnsupportedQuery("case_insensitive term")
+            value = value['value']
+        return self.__contains(scope, field, [value])
+
+    def __terms(self, body, scope):
+        field, values = self.__field_query(body)
+        if not isinstance(values, list):
+            raise UnsupportedQuery(f"Terms lookup {values}")
+        return self.__contains(scope, field, values)
+
+    def __contains(self, scope, field, values):
+        type_ = self.field_type(field)
+        if type_ == TEXT:
+            tokens = scope.tokens(field)
+            return any(str(v_) in tokens for v_ in values)
+        found = scope.values(field)
+        if any(same(v_, f_) for v_ in values for f_ in found):
+            return True
+        # unknown type: maybe a text field, whose terms are its tokens
+        return type_ is None and any(str(v_) in scope.tokens(field) for v_ in values)
+
+    def __match(self, body, scope):
+        field, params = self.__field_query(body)
+        params = params if isinstance(params, dict) else {'query': params}
+        if params.get('fuzziness') or params.get('analyzer'):
+            raise UnsupportedQuery(f"Match parameters {params}")
+        if self.field_type(field) not in (TEXT, None):
+            return self.__contains(scope, field, [params['query']])
+        words = set(analyze(params['query']))
+        if not words:
+            return False
+        tokens = scope.tokens(field)
+        n = sum(w_ in tokens for w_ in words)
+        if params.get('operator', 'or').lower() == 'and':
+            return n == len(words)
+        return n >= max(1, minimum_should_match(params.get('minimum_should_match', 1), len(words)))
+
+    def __match_phrase(self, body, scope):
+        field, params = self.__field_query(body)
+        params = params if isinstance(params, dict) else {'query': params}
+        if params.get('slop'):
+            raise UnsupportedQuery("match_phrase slop")
+        phrase = analyze(params['query'])
+        return any(contains_sequence(analyze(v_), phrase) for v_ in scope.values(field))
+
+    def __prefix(self, body, scope):
+        field, value = self.__field_query(body)
+        value = str(value['value'] if isinstance(value, dict) else value)
+        return any(str(v_).startswith(value) for v_ in scope.values(field))
+
+    def __range(self, body, scope):
+        field, bounds = self.__field_query(body)
+        if bounds.get('format') or bounds.get('time_zone') or bounds.get('relation'):
+            raise UnsupportedQuery(f"Range parameters {bounds}")
+        checks = [(op_, comparable(bounds[op_])) for op_ in ('gt', 'gte', 'lt', 'lte') if bounds.get(op_) is not None]
+        for v_ in scope.values(field):
+            v_ = comparable(v_)
+            try:
+                if all((op_ == 'gt' and v_ > b_) or (op_ == 'gte' and v_ >= b_) or
+                       (op_ == 'lt' and v_ < b_) or (op_ == 'lte' and v_ <= b_) for op_, b_ in checks):
+                    return True
+            except TypeError:
+                raise UnsupportedQuery(f"Cannot compare {v_!r} with {bounds}")
+        return False
+
+    def __exists(self, body, scope):
+        # an object exists when it has any field
+        return any(v_ not in ('', {}) for v_ in scope.objects(self.__check_field(body['field'])))
+
+    def __ids(self, body, scope):
+        return scope.id in {str(v_) for v_ in body['values']}
+
+    def __nested(self, body, scope):
+        return any(self.matches(body['query'], inner) for inner in scope.nested(body['path']))
+
+
+class Scope:
+    """
+    the document a query is evaluated against, or a nested object of it, with its values and tokens memoized
+    """
+    def __init__(self, source, id_=None, path=''):
+        self.source = source
+        self.id = str(id_) if id_ is not None else None
+        self._path = path
+        self._values = {}
+        self._tokens = {}
+
+    def values(self, field):
+        if (values := self._values.get(field)) is None:
+            relative = field[len(self._path) + 1:] if self._path and field.startswith(self._path + '.') else field
+            if not (values := resolve(self.source, relative)) and '.' in relative:
+                parent, sub_name = relative.rsplit('.', 1)
+                parent_values = resolve(self.source, parent)
+                if any(not isinstance(v_, dict) for v_ in parent_values):
+                    # a sub-field of a value: the keyword one indexes the same value, the others are unknown
+                    if sub_name != KEYWORD:
+                        raise UnsupportedQuery(f"Sub-field {field}")
+                    values = parent_values
+            # objects are not values, only their leaves are indexed
+            values = self._values[field] = [v_ for v_ in values if not isinstance(v_, dict)]
+        return values
+
+    def objects(self, field):
+        """
+        :return: the values at the field, objects included
+        """
+        return resolve(self.source, field[len(self._path) + 1:] if self._path and field.startswith(self._path + '.')
+                       else field)
+
+    def tokens(self, field):
+        if (tokens := self._tokens.get(field)) is None:
+            tokens = self._tokens[field] = {t_ for v_ in self.values(field) for t_ in analyze(v_)}
+        return tokens
+
+    def nested(self, path):
+        relative = path[len(self._path) + 1:] if self._path and path.startswith(self._path + '.') else path
+        objects = [self.source]
+        for key in relative.split('.'):
+            objects = [c_ for o_ in objects if isinstance(o_, dict)
+                       for c_ in as_list(o_.get(key))]
+        return [Scope(o_, self.id, path) for o_ in objects if isinstance(o_, dict)]
+
+
+def as_list(v):
+    if v is None:
+        return []
+    return v if isinstance(v, list) else [v]
+
+
+def minimum_should_match(msm, n):
+    """
+    :return: number of clauses given an ES minimum_should_match, e.g. 2, -1, "75%", "-25%"
+    """
+    if isinstance(msm, str):
+        if msm.endswith('%') and msm[:-1].lstrip('-').isdigit():
+            percent = int(msm[:-1])
+            k_ = int(n * abs(percent) / 100)
+            return n - k_ if percent < 0 else k_
+        if not msm.lstrip('-').isdigit():
+            # e.g. combinations like "3<90%"
+            raise UnsupportedQuery(f"minimum_should_match {msm}")
+        msm = int(msm)
+    return n + msm if msm < 0 else msm
+
+
+def same(query_value, field_value):
+    if isinstance(query_value, bool) or isinstance(field_value, bool):
+        return str(query_value).lower() == str(field_value).lower()
+    if isinstance(query_value, (int, float)) or isinstance(field_value, (int, float)):
+        try:
+            return float(query_value) == float(field_value)
+        except (TypeError, ValueError):
+            return False
+    return str(query_value) == str(field_value)
+
+
+def comparable(v):
+    """
+    numbers as floats, date math like now-3y and dates as datetimes, other strings as they are
+    """
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    if not isinstance(v, str):
+        raise UnsupportedQuery(f"Cannot compare {v!r}")
+    try:
+        return float(v)
+    except ValueError:
+        pass
+    if m_ := DATE_MATH_REGEX.match(v):
+        sign, n, unit = m_.groups()
+        delta = timedelta(days=int(n) * DATE_MATH_UNITS[unit]) if n else timedelta()
+        return datetime.now() + (delta if sign == '+' else -delta)
+    if (date_ := parse_date(v)) is None:
+        raise UnsupportedQuery(f"Cannot compare {v!r}")
+    return date_
+
+
+@lru_cache(maxsize=100000)
+def parse_date(v):
+    """
+    :return: datetime of the date formats of the docs, None if v is none of them
+    """
+    try:
+        # e.g. 2020-01-01T00:00:00Z, 2020-01-01T00:00:00.123Z, 2020-01-01
+        return datetime.fromisoformat(v[:-1] if v.endswith('Z') else v)
+    except ValueError:
+        return None
+
+
+def contains_sequence(tokens, phrase):
+    n = len(phrase)
+    return n > 0 and any(tokens[k_:k_ + n] == phrase for k_ in range(len(tokens) - n + 1))
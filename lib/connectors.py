@@ -1,12 +1,28 @@
 import json
-import mariadb
-from environments import JOB_USELESS_KEYS, TALENT_USELESS_KEYS
-from libsearcher.pylibshared.utils.logger import get_logger
-logger = get_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+import time
+import threading
+from lib.payload_normalizer import JOB_NORMALIZER, TALENT_NORMALIZER, JOB_V2_NORMALIZER, TALENT_V2_NORMALIZER
+from lib.metrics import METRICS
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+
+
+# t.`status`, t.tenant_id, t.created_date,
+APPLICATION_FILTER = """
+    FROM application t WHERE t.tenant_id = 4 AND t.job_id not in (1197,1198,1196) and t.status in (4,5,6,7,9,12,13)
+    and t.created_date > "2018-06-01" AND t.id > ?
+    """
+APPLICATION_QUERY = """
+    SELECT t.id, t.talent_id, t.job_id,
+    CASE (SELECT 1 from activity_unique a WHERE a.application_id = t.id AND a.`status` = 4) WHEN 1 THEN 'True' ELSE 'False' END isInterviewed
+    """ + APPLICATION_FILTER
+APPLICATION_ID_QUERY = "SELECT t.id " + APPLICATION_FILTER
+FETCH_BATCH_SIZE = 500
 
 
 class MariaDBFetcher:
     def __init__(self, server, user, password, db):
+        import mariadb
         host, port = server.split(':')
         print(f"Connect to {host}:{port}, db={db}")
         try:
@@ -22,108 +38,195 @@ class MariaDBFetcher:
             print(f"Error connecting to MariaDB Platform: {e}")
             raise e
 
-    def fetch(self, skip=0):
+    def fetch(self, skip=0, page_size=10000, after_id=0):
+        """
+        keyset pagination on application.id, each page is read by fetchmany
+        :param skip: number of applications skipped on the server side
+        :param after_id: only the applications whose id is greater than it
+        :return: generator of (talent_id, job_id, isInterviewed)
+        """
         cur = self.__conn.cursor()
-        # t.`status`, t.tenant_id, t.created_date,
-        cur.execute(
-            """
-            SELECT t.talent_id, t.job_id, 
-            CASE (SELECT 1 from activity_unique a WHERE a.application_id = t.id AND a.`status` = 4) WHEN 1 THEN 'True' ELSE 'False' END isInterviewed
-            FROM application t WHERE t.tenant_id = 4 AND t.job_id not in (1197,1198,1196) and t.status in (4,5,6,7,9,12,13) and t.created_date > "2018-06-01" ;
-            """)
-        for sample in cur:
-            if skip <= 0:
-                yield sample
-            else:
-                skip -= 1
+        if skip > 0:
+            cur.execute(APPLICATION_ID_QUERY + " ORDER BY t.id LIMIT 1 OFFSET ?", (after_id, skip - 1))
+            if not (first := cur.fetchone()):
+                cur.close()
+                return
+            after_id = first[0]
+        try:
+            while True:
+                cur.execute(APPLICATION_QUERY + " ORDER BY t.id LIMIT ?", (after_id, page_size))
+                n = 0
+                while samples := cur.fetchmany(FETCH_BATCH_SIZE):
+                    for sample in samples:
+                        n += 1
+                        after_id = sample[0]
+                        yield sample[1:]
+                if n < page_size:
+                    break
+        finally:
+            cur.close()
 
 
 GENERAL_HEADER = {'Content-Type': 'application/json', 'charset': 'UTF-8'}
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def create_session(pool_size=10, retries=3, backoff_factor=0.5):
+    """
+    keep-alive session whose connections are pooled per host,
+    5xx responses and connection resets are retried with exponential backoff
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                  backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                  method_whitelist=frozenset(('GET', 'POST')), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class EndpointStats:
+    """
+    number of calls, errors and seconds spent per endpoint, the seconds are also observed by METRICS
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, seconds, error=False):
+        with self._lock:
+            s_ = self._stats.setdefault(endpoint, {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            s_['calls'] += 1
+            s_['errors'] += int(error)
+            s_['seconds'] += seconds
+            s_['max_seconds'] = max(s_['max_seconds'], seconds)
+        METRICS.observe(endpoint, seconds)
+        if error:
+            METRICS.count(endpoint + '.errors')
+
+    def summary(self):
+        with self._lock:
+            return {k: dict(v, mean_seconds=v['seconds'] / v['calls']) for k, v in self._stats.items()}
+
+    def request(self, session, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        error = True
+        try:
+            response = session.request(method, url, **kwargs)
+            error = response.status_code >= 400
+            return response
+        finally:
+            self.record(endpoint, time.perf_counter() - start, error)
 
 
 class APN:
-    def __init__(self, host, refresh_token):
+    def __init__(self, host, refresh_token, cache=None, pool_size=10, retries=3, backoff_factor=0.5, timeout=60):
+        """
+        :param cache: APNCache of the formatted payloads, None to always call the API
+        """
         self.__host = host
+        self.__cache = cache
         self.__refresh_token = refresh_token
         self.__header = GENERAL_HEADER.copy()
         self.__token_renewed = False
+        self.__token_lock = threading.Lock()
+        self.__session = create_session(pool_size, retries, backoff_factor)
+        self.__timeout = timeout
+        self.stats = EndpointStats()
+
+    def __ensure_access_token(self, expired=None):
+        """
+        :param expired: the Authorization header rejected by APN, it is renewed unless another caller did it
+        """
+        # concurrent harvests share one APN object, only the first caller renews the token
+        if self.__token_renewed and expired is None:
+            return
+        with self.__token_lock:
+            if not self.__token_renewed or self.__header.get('Authorization') == expired:
+                self.__renew_access_token()
+
+    def __get(self, endpoint, path):
+        self.__ensure_access_token()
+        header = self.__header.copy()
+        response = self.stats.request(self.__session, endpoint, "GET", self.__host + path,
+                                      headers=header, timeout=self.__timeout)
+        if response.status_code == 401:
+            logger.info(f"Access token expired, renewing it for {path}")
+            self.__ensure_access_token(expired=header.get('Authorization'))
+            response = self.stats.request(self.__session, endpoint, "GET", self.__host + path,
+                                          headers=self.__header.copy(), timeout=self.__timeout)
+        return response
 
     def __renew_access_token(self):
         """
         https://api.hitalentech.com/api/v1/refresh-token
         :return:
         """
-        response_ = requests.request("POST", self.__host + '/api/v1/refresh-token',
-                                     headers=GENERAL_HEADER,
-                                     data=json.dumps({"refresh_token": self.__refresh_token}).encode('utf-8'))
+        response_ = self.stats.request(self.__session, 'apn.refresh_token', "POST",
+                                       self.__host + '/api/v1/refresh-token', headers=GENERAL_HEADER,
+                                       data=json.dumps({"refresh_token": self.__refresh_token}).encode('utf-8'),
+                                       timeout=self.__timeout)
         logger.debug(f"Refreshed token: {response_.text}")
         self.__header['Authorization'] = rf'Bearer {response_.json()["access_token"]}'
         self.__token_renewed = True
 
-    @staticmethod
-    def __format_job_data(data):
-        if isinstance(data, dict):
-            data = dict((k, v_) for k, v in data.items() if k not in JOB_USELESS_KEYS
-                        and (v_ := APN.__format_job_data(v)) is not None)
-        elif isinstance(data, list):
-            data = list(v_ for v in data if (v_ := APN.__format_job_data(v)) is not None)
-        if data in (None, 'None', '', [], {}):
-            return None
-        if isinstance(data, str):
-            data = data.strip()
-        return data
-
-    @staticmethod
-    def __format_talent_data(data):
-        if isinstance(data, dict):
-            data = dict((k, v_) for k, v in data.items() if k not in TALENT_USELESS_KEYS
-                        and (v_ := APN.__format_talent_data(v)) is not None)
-        elif isinstance(data, list):
-            data = list(v_ for v in data if (v_ := APN.__format_talent_data(v)) is not None)
-        if data in (None, 'None', '', [], {}):
-            return None
-        if isinstance(data, str):
-            data = data.strip()
-        return data
-
     def get_talent(self, id_):
-        if not self.__token_renewed:
-            self.__renew_access_token()
-        response = requests.request("GET", self.__host + f'/api/v1/talents/{id_}', headers=self.__header)
-        response_body = response.json()
-        if 'error' in response_body:
-            raise ConnectionResetError(f"{response_body}")
-        return APN.__format_talent_data(response_body)
+        if self.__cache:
+            return self.__cache.get_or_fetch('talent', id_, lambda: self.__fetch('talent', id_, TALENT_NORMALIZER))
+        return self.__fetch('talent', id_, TALENT_NORMALIZER)
 
     def get_job(self, id_):
-        if not self.__token_renewed:
-            self.__renew_access_token()
-        response = requests.request("GET", self.__host + f'/api/v1/jobs/{id_}', headers=self.__header)
+        if self.__cache:
+            return self.__cache.get_or_fetch('job', id_, lambda: self.__fetch('job', id_, JOB_NORMALIZER))
+        return self.__fetch('job', id_, JOB_NORMALIZER)
+
+    def get_talent_v2(self, id_):
+        """
+        talent_v1_to_v2(self.get_talent(id_)), converted within the normalization pass when not cached
+        """
+        if self.__cache:
+            return TALENT_V2_NORMALIZER.finalize(self.get_talent(id_))
+        return self.__fetch('talent', id_, TALENT_V2_NORMALIZER)
+
+    def get_job_v2(self, id_):
+        """
+        job_v1_to_v2(self.get_job(id_)), converted within the normalization pass when not cached
+        """
+        if self.__cache:
+            return JOB_V2_NORMALIZER.finalize(self.get_job(id_))
+        return self.__fetch('job', id_, JOB_V2_NORMALIZER)
+
+    def __fetch(self, kind, id_, normalizer):
+        response = self.__get(f'apn.{kind}', f'/api/v1/{kind}s/{id_}')
         response_body = response.json()
         if 'error' in response_body:
             raise ConnectionResetError(f"{response_body}")
-        return APN.__format_job_data(response_body)
-
-
-import requests
+        return normalizer(response_body)
 
 
 class ESFiller:
-    def __init__(self, server='localhost:5050'):
+    def __init__(self, server='localhost:5050', pool_size=10, retries=3, backoff_factor=0.5, timeout=300):
         self._address = 'http://' + server
+        self._session = create_session(pool_size, retries, backoff_factor)
+        self._timeout = timeout
+        self.stats = EndpointStats()
+
+    def __post(self, endpoint, path, doc):
+        return self.stats.request(self._session, endpoint, "POST", url=self._address + path,
+                                  headers={'Content-Type': 'application/json'},
+                                  data=json.dumps(doc, ensure_ascii=False).encode('utf-8'),
+                                  timeout=self._timeout)
 
     def fill_job(self, doc, id_):
-        response = requests.request("POST",
-                                    url=self._address + f'/filler/v2/sync/tenant/10/job/{id_}/fill_es/',
-                                    headers={'Content-Type': 'application/json'},
-                                    data=json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+        response = self.__post('filler.job', f'/filler/v2/sync/tenant/10/job/{id_}/fill_es/', doc)
         return response.json()
 
     def fill_talent(self, doc, id_):
-        response = requests.request("POST",
-                                    url=self._address + f'/filler/v2/sync/tenant/10/talent/{id_}/fill_es/',
-                                    headers={'Content-Type': 'application/json'},
-                                    data=json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+        response = self.__post('filler.talent', f'/filler/v2/sync/tenant/10/talent/{id_}/fill_es/', doc)
         try:
             return response.json()
         except Exception as e:
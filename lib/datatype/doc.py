@@ -1,5 +1,5 @@
 import re
-from geopy.point import Point
+from functools import lru_cache
 
 from libsearcher.pylibshared.datatype import LocationInfo, OfficialLocationInfo
 from libsearcher.utils.title_synonym import title_synonym
@@ -8,13 +8,36 @@ from libsearcher.pylibshared.enumerations import Levels, Degree
 from libsearcher.pylibshared.enumerations.location.country import get_country
 # from lib.utils.wordvecs_provider import get_skills_vector
 from libsearcher.pylibshared.utils.string_utils import list_in_list
-from libsearcher.pylibshared.utils.logger import get_logger
-logger = get_logger(__name__, 'INFO', to_file=True, to_stdout=True)
+from lib.lazy import lazy_logger, lazy_slot
+logger = lazy_logger(__name__, 'INFO', to_file=True, to_stdout=True)
 TIME_REGULATOR_REGEX = re.compile(r'\.[0-9]*Z')
 
 
+@lru_cache(maxsize=100000)
+def _title_synonyms(tokenized_title):
+    return tuple(title_synonym.get_title_synonyms(tokenized_title))
+
+
+def get_title_synonyms(tokenized_title):
+    """
+    memoized title_synonym.get_title_synonyms, titles repeat across docs
+    """
+    try:
+        return _title_synonyms(tokenized_title)
+    except TypeError:
+        # unhashable, e.g. a list of tokens
+        return tuple(title_synonym.get_title_synonyms(tokenized_title))
+
+
 class Doc:
+    """
+    read-only view of an ES hit, the derived fields are computed on first access and cached,
+    _source is never modified
+    """
     LOCATIONS_KEY = None
+    __slots__ = ('_id', '_index', '_source', '_locations', '_countries', '_country_codes', '_tokenized_titles',
+                 '_level_score', '_skill_dict', '_view', '_last_modified_date_str', '_company',
+                 '_regulated_company_name', '_job_function_subs')
 
     def __init__(self, doc: dict):
         """
@@ -24,53 +47,16 @@ class Doc:
         # index and id
         if _id := doc.get('_id', None):
             self._id = str(_id)
-            _index = doc.get('_index', None)
+            self._index = doc.get('_index', None)
         else:
             raise ValueError(f"Doc _id is missing: {doc}")
         if not (_source := doc.get('_source', None)):
             raise ValueError(f"Doc _source is missing: {doc}")
-        logger.debug(f"Building {_index}/{self._id}...")
-        # job function and industries
-        self._job_functions = _source.get('jobFunctions', [])
-        self._industries = _source.get('industries', [])
-        # load location
-        self._locations = [LocationInfo.create_from_dict(l_) for l_ in _source.get(self.LOCATIONS_KEY, [])]
-        self._countries = [LocationInfo(country=l_.get('country', ""),
-                                        official_loc=OfficialLocationInfo(country=l_.get('officialCountry', "")))
-                           for l_ in _source.get(self.LOCATIONS_KEY, [])]
-        self._tokenized_titles = []
-
-        tokenized_titles = _source.get('tokenizedTitles', [])
-        for tokenized_title in tokenized_titles:
-            for title_ in title_synonym.get_title_synonyms(tokenized_title):
-                self._tokenized_titles.append(title_)
-        try:
-            level_str = _source.get('level', "JUNIOR")
-            self._level_score = Levels.__getattr__(level_str).score
-        except AttributeError:
-            self._level_score = None
-            logger.error(f"Received unknown title level {_source.get('level')}")
-        # load skills
-        # to be compatible with the old version, still load tokenizedSkills here
-        self._skill_dict = {}
-        regulated_names = []
-        for skill in _source.get('skills', []):
-            if skill_name := skill.pop('skillName', None):
-                skill.pop('lastModifiedDate', None)
-                self._skill_dict[skill_name] = skill
-
+        self._source = _source
+        logger.debug("Building %s/%s...", self._index, self._id)
         # self._skill_vectors = get_skills_vector(regulated_names)
-        # initialize titles with the level(current) titles
-        logger.debug(f"Title: {self._tokenized_titles}, level={self._level_score}")
         # if prepare_for_search:
         #     self.__prepare_for_search(doc_dict)
-        # copy the keys that will be shown in UI
-        self._view = {'esId': self._id, 'index': _index}
-        # for k in COMMON_VIEW_KEYS:
-        #     v = doc_dict.get(k, None)
-        #     if not v:
-        #         continue
-        #     self._view[k] = v
 
     @staticmethod
     def _get_degree(degree: str):
@@ -86,10 +72,10 @@ class Doc:
         self._regulated_company_name = doc_dict.get('companyInfo', {}).get("regulatedCompanyName", None)
 
     def __repr__(self):
-        return f"{self._view}"
+        return f"{self.view}"
 
     def __str__(self):
-        return f"{self._view}"
+        return f"{self.view}"
 
     @property
     def id(self):
@@ -103,54 +89,83 @@ class Doc:
     def company(self):
         return self._company
 
-    @property
+    @lazy_slot
     def tokenized_titles(self):
         """
         if talent has working experience, it will be his/her most recent titles
         for freshmen, it is the highest and latest major name
         :return:
         """
-        return self._tokenized_titles
+        tokenized_titles = []
+        for tokenized_title in self._source.get('tokenizedTitles', []):
+            tokenized_titles.extend(get_title_synonyms(tokenized_title))
+        return tokenized_titles
 
     @property
     def job_functions(self):
-        return self._job_functions
+        return self._source.get('jobFunctions', [])
 
     @property
     def job_function_subs(self):
         return self._job_function_subs
 
-    @property
+    @lazy_slot
     def level_score(self):
         """
         :return: level scores, its length must be the same as the title vector length
         """
-        return self._level_score
+        try:
+            return Levels.__getattr__(self._source.get('level', "JUNIOR")).score
+        except AttributeError:
+            logger.error(f"Received unknown title level {self._source.get('level')}")
+            return None
 
     @property
     def industries(self):
-        return self._industries
+        return self._source.get('industries', [])
 
     @property
     def industry_vector(self):
         return None
 
-    @property
+    @lazy_slot
     def last_modified_date_str(self) -> str:
-        return self._last_modified_date_string
+        return self._source.get('lastModifiedDate', None)
 
-    @property
+    @lazy_slot
     def skill_dict(self):
-        return self._skill_dict
+        # to be compatible with the old version, still load tokenizedSkills here
+        skill_dict = {}
+        for skill in self._source.get('skills', []):
+            if skill_name := skill.get('skillName', None):
+                skill_dict[skill_name] = {k_: v_ for k_, v_ in skill.items()
+                                          if k_ not in ('skillName', 'lastModifiedDate')}
+        return skill_dict
 
     # @property
     # def skill_vectors(self):
     #     return self._skill_vectors
 
-    @property
+    @lazy_slot
     def locations(self):
-        return self._locations
+        return [LocationInfo.create_from_dict(l_) for l_ in self._source.get(self.LOCATIONS_KEY, [])]
 
-    @property
+    @lazy_slot
+    def countries(self):
+        return [LocationInfo(country=l_.get('country', ""),
+                             official_loc=OfficialLocationInfo(country=l_.get('officialCountry', "")))
+                for l_ in self._source.get(self.LOCATIONS_KEY, [])]
+
+    @lazy_slot
+    def country_codes(self):
+        return frozenset(c_ for l_ in self._source.get(self.LOCATIONS_KEY, []) if (c_ := l_.get('country', None)))
+
+    @lazy_slot
     def view(self):
-        return self._view
+        # copy the keys that will be shown in UI
+        # for k in COMMON_VIEW_KEYS:
+        #     v = doc_dict.get(k, None)
+        #     if not v:
+        #         continue
+        #     self._view[k] = v
+        return {'esId': self._id, 'index': self._index}
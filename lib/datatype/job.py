@@ -12,67 +12,122 @@ from libsearcher.pylibshared.datatype import LocationInfo
 # from configs.view_keys import JOB_VIEW_KEYS
 # from lib.utils.wordvecs_provider import get_industries_title_vector
 from lib.datatype.doc import Doc
-from libsearcher.pylibshared.utils.logger import get_logger
-logger = get_logger(__name__, 'DEBUG', to_file=True, to_stdout=True)
+from lib.lazy import lazy_logger, lazy_slot
+logger = lazy_logger(__name__, 'DEBUG', to_file=True, to_stdout=True)
+CONDITION_NAMES = ('skill', 'location', 'experience', 'language', 'job_function_or_title', 'degree')
 
 
 class Job(Doc):
     LOCATIONS_KEY = 'locations'
+    __slots__ = ('_required_languages', '_preferred_languages', '_required_degree', '_bool_obj', '_exp_range',
+                 '_title_searcher', '_min_exp', '_max_exp', '_minimum_degree_score', '_required_conditions',
+                 '_condition_names')
 
     def __init__(self, job: dict):
         """
         :param job: raw object gotten from Elastic get and search APIs
         :return: reformatted information ready for combining with talents
         """
-        super().__init__(job)  # loaded id, lastModifiedDate, skills, location
-        job_dict = job.get('_source', None)  # _source is for elastic data, our data file is just talent
-        # load languages
-        self._required_languages = job_dict.get('requiredLanguages', [])
-        self._preferred_languages = job_dict.get('preferredLanguages', [])
-        self._required_degree = self._get_degree(job_dict.get('minimumDegreeLevel', None))
-        self._bool_obj = job_dict.get('boolObj', [])   # boolean object for skill search
-        self._exp_range = job_dict.get('experienceYearRange', {})
-        self._job_functions = job_dict.get('jobFunctions', [])
-        if title := job_dict.get('title', None):
+        super().__init__(job)  # loaded id, _source; the fields below are read from _source on first access
+
+    @lazy_slot
+    def required_languages(self):
+        return self._source.get('requiredLanguages', [])
+
+    @lazy_slot
+    def preferred_languages(self):
+        return self._source.get('preferredLanguages', [])
+
+    @lazy_slot
+    def required_degree(self):
+        return self._get_degree(self._source.get('minimumDegreeLevel', None))
+
+    @lazy_slot
+    def bool_obj(self):
+        # boolean object for skill search
+        return self._source.get('boolObj', [])
+
+    @lazy_slot
+    def exp_range(self):
+        return self._source.get('experienceYearRange', {})
+
+    @lazy_slot
+    def min_exp(self):
+        return self.exp_range.get('gte', self.exp_range.get('gt', np.nan))
+
+    @lazy_slot
+    def max_exp(self):
+        return self.exp_range.get('lte', self.exp_range.get('lt', np.nan))
+
+    @lazy_slot
+    def title_searcher(self):
+        if title := self._source.get('title', None):
             titles = title.split('|')
         else:
             titles = []
-        self._title_searcher = TitleSearcher(
+        return TitleSearcher(
             titles=titles, search_modes=(TitleSearchMode.CURRENT,),
             title_words_minimum_should_match='2',
             concern_return_value=False,
             search_synonym=True,
             invalid_fields=None)
-        self._min_exp, self._max_exp = self._exp_range.get('gte', np.NaN), self._exp_range.get('lte', np.NaN)
 
-    def get_required_conditions(self):
-        skill_ = TalentConditions.create_from_ui_json(self._bool_obj) if self._bool_obj else None
+    @lazy_slot
+    def required_conditions(self):
+        """
+        :return: {name in CONDITION_NAMES: condition, None if the job does not require it}
+        """
+        skill_ = TalentConditions.create_from_ui_json(self.bool_obj) if self.bool_obj else None
         location_ = TalentConditions(conditions=[
-            LocationSearcher(search_mode=LocationSearchMode.PREFERRED, location_info=loc) for loc in self._countries
+            LocationSearcher(search_mode=LocationSearchMode.PREFERRED, location_info=loc) for loc in self.countries
         ], operator=Operator.should)
-        if (tolerance_min := self._exp_range.get('gte', self._exp_range.get('gt', 0)) // 3) > 2:
+        exp_range = self.exp_range
+        if (tolerance_min := exp_range.get('gte', exp_range.get('gt', 0)) // 3) > 2:
             tolerance_min = 2
-        if (tolerance_max := self._exp_range.get('lte', self._exp_range.get('lt', 0)) // 3) > 3:
+        if (tolerance_max := exp_range.get('lte', exp_range.get('lt', 0)) // 3) > 3:
             tolerance_max = 3
-        exp_ = ExperienceYearSearcher(range_=self._exp_range,
+        exp_ = ExperienceYearSearcher(range_=exp_range,
                                       # e.g. require 6-9 years, we search 4-12 years
                                       # e.g. require 2-6 years, we search 2-9 years
                                       tolerance_min=tolerance_min,
-                                      tolerance_max=tolerance_max) if self._exp_range else None
+                                      tolerance_max=tolerance_max) if exp_range else None
         language_ = TalentConditions(
-            conditions=[LanguageSearcher(keywords=[lang_], key='languages') for lang_ in self._required_languages],
+            conditions=[LanguageSearcher(keywords=[lang_], key='languages') for lang_ in self.required_languages],
             operator=Operator.must
         )
         jf_or_title = TalentConditions(
-            conditions=[JobFunctionSearcher(keywords=self._job_functions, key='jobFunctions'),
-                        self._title_searcher],
+            conditions=[JobFunctionSearcher(keywords=self.job_functions, key='jobFunctions'),
+                        self.title_searcher],
             operator=Operator.should
         )
-        if self._required_degree:
-            degree_ = DegreeSearcher(degrees=[self._required_degree], search_mode=DegreeSearchMode.NOT_UNDER)
+        if required_degree := self.required_degree:
+            degree_ = DegreeSearcher(degrees=[required_degree], search_mode=DegreeSearchMode.NOT_UNDER)
         else:
             degree_ = None
-        return list(filter(None, [skill_, location_, exp_, language_, jf_or_title, degree_]))
+        return dict(zip(CONDITION_NAMES, (skill_, location_, exp_, language_, jf_or_title, degree_)))
+
+    def get_required_conditions(self):
+        return list(filter(None, self.required_conditions.values()))
+
+    @lazy_slot
+    def condition_names(self):
+        """
+        :return: {id of a required condition or of one of its sub-conditions: its name in CONDITION_NAMES}
+        """
+        names = {}
+        for name, cond_ in self.required_conditions.items():
+            if cond_ is None:
+                continue
+            names[id(cond_)] = name
+            # an unsatisfied must collection is reported by its sub-conditions
+            names.update((id(c_), name) for c_ in getattr(cond_, '_conditions', ()))
+        return names
+
+    def condition_name(self, condition):
+        """
+        :return: name in CONDITION_NAMES of a required condition or of one of its sub-conditions, None if neither
+        """
+        return self.condition_names.get(id(condition))
 
     def __get_end_date(self, end_date_string, last_activity_time_string):
         try:
@@ -80,21 +135,11 @@ class Job(Doc):
                 return datetime.strptime(end_date_string, '%Y-%m-%d')
             if last_activity_time_string:
                 return datetime.strptime(last_activity_time_string.split('T')[0], '%Y-%m-%d')
-            if self._last_modified_date_string and self._status not in (JobStatus.Open, JobStatus.Reopened):
-                return datetime.strptime(self._last_modified_date_string.split('T')[0], '%Y-%m-%dT%H:%M:%SZ')
+            if self.last_modified_date_str and self._status not in (JobStatus.Open, JobStatus.Reopened):
+                return datetime.strptime(self.last_modified_date_str.split('T')[0], '%Y-%m-%dT%H:%M:%SZ')
         except ValueError:
             logger.warn(f'Cannot read job end date: '
-                        f'{end_date_string}/{last_activity_time_string}/{self._last_modified_date_string}')
-
-    def __repr__(self):
-        return f"{self._view}"
-
-    def __str__(self):
-        return f"{self._view}"
-
-    @property
-    def id(self):
-        return self._id
+                        f'{end_date_string}/{last_activity_time_string}/{self.last_modified_date_str}')
 
     @property
     def title_vector(self):
@@ -102,7 +147,7 @@ class Job(Doc):
 
     @property
     def boolstr(self):
-        return self._bool_obj
+        return self.bool_obj
 
     @property
     def experience_yr_range(self):
@@ -112,9 +157,9 @@ class Job(Doc):
     def preferred_degree_scores(self):
         return self._preferred_degree_scores
 
-    @property
+    @lazy_slot
     def minimum_degree_score(self):
-        return self._minimum_degree_score
+        return self.required_degree.score if self.required_degree else np.nan
 
     @property
     def ending_date(self):
@@ -124,26 +169,10 @@ class Job(Doc):
     def posting_date(self):
         return self._posting_date
 
-    @property
-    def last_modified_date_str(self) -> str:
-        return self._last_modified_date_string
-
     @property
     def skill_vectors(self):
         return self._skill_vectors
 
-    @property
-    def view(self):
-        return self._view
-
-    @property
-    def preferred_languages(self):
-        return self._preferred_languages
-
-    @property
-    def required_languages(self):
-        return self._required_languages
-
 
 def get_posting_date(job_dict: dict):
     """
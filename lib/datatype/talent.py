@@ -1,124 +1,162 @@
+import itertools
+import importlib
 import numpy as np
 from datetime import datetime
-from configs.ml import FEATURE_MIN_MAX_MAPPING
+from functools import lru_cache
 from lib.datatype.doc import Doc
-from libquerynormalization.configs.environments import COMMON_DB_INDEX
-from configs.view_keys import TALENT_VIEW_KEYS
-from lib.utils.wordvecs_provider import get_industries_title_vector
-from libsearcher.pylibshared.utils.logger import get_logger
-logger = get_logger(__name__, 'DEBUG', to_file=False, to_stdout=True)
-MAX_UNIV_RANK = FEATURE_MIN_MAX_MAPPING['talent_university_rank'][1]
+from lib.lazy import Lazy, lazy_logger, lazy_slot
+logger = lazy_logger(__name__, 'DEBUG', to_file=False, to_stdout=True)
+# configs, libquerynormalization and the word vectors are imported by the members using them, pandas on first use
+pd = Lazy(lambda: importlib.import_module('pandas'))
+TALENT_FEATURES = ('posting_days', 'current_career_years', 'university_rank', 'best_company_class',
+                   'highest_degree_score')
+
+
+@lru_cache(maxsize=1)
+def max_univ_rank():
+    from configs.ml import FEATURE_MIN_MAX_MAPPING
+    return FEATURE_MIN_MAX_MAPPING['talent_university_rank'][1]
 
 
 class Talent(Doc):
     LOCATIONS_KEY = 'preferredLocations'
-
+    __slots__ = ('_date', '_languages', '_skills_in_title', '_title_vectors', '_highest_degree_score',
+                 '_best_company_class', '_dates', '_current_career_years', '_educations')
 
     def __init__(self, talent: dict, date_: datetime):
         """
         :param talent: raw objects gotten from Elastic get and search APIs
         :return: reformatted information ready for combining with jobs
         """
-        super().__init__(talent)  # loaded id, lastModifiedDate, skills, location
+        super().__init__(talent)  # loaded id, _source; the features below are read from _source on first access
         self._date = date_
-        talent_dict = talent.get('_source', talent)  # _source is for elastic data, our data file is just talent
-        self._from_common_db = talent.get('_index', None) == COMMON_DB_INDEX
-        # load degree
-        self._highest_degree_score = talent_dict.get('highestDegreeScore', np.NaN)
-        if self._highest_degree_score is None:
-            self._highest_degree_score = np.NaN
-        # languages
-        self._languages = set()
-        for language in talent_dict.get('languages', []):
+
+    @lazy_slot
+    def tokenized_titles(self):
+        # title or major
+        # for freshmen, use major name as title
+        if tokenized_titles := Doc.tokenized_titles.func(self):
+            return tokenized_titles
+        tokenized_titles = self._source.get('tokenizedMajors', [])
+        # todo: remove this --- temp data fix {start} --- tokenizedMajors[0] is a list
+        if tokenized_titles and isinstance(tokenized_titles[0], list):
+            tokenized_titles = [t_ for t_ in itertools.chain(*tokenized_titles)]
+        # --- temp data fix {end} --- tokenizedMajors[0] is a list
+        return tokenized_titles
+
+    @lazy_slot
+    def languages(self):
+        languages = set()
+        for language in self._source.get('languages', []):
             # todo -- remove dict format - {start}
             if isinstance(language, dict):
                 language = language["regulatedName"]
             # todo -- remove dict format - {end}
-            self._languages.add(language)
-            for tokenized_title in self._tokenized_titles:
-                if language.replace('_', ' ').lower() in tokenized_title.lower():
-                    self._skills_in_title.add(language)
-        # title or major
-        # for freshmen, use major name as title
-        if not self._tokenized_titles:
-            self._tokenized_titles = talent_dict.get('tokenizedMajors', [])
-            # todo: remove this --- temp data fix {start} --- tokenizedMajors[0] is a list
-            if self._tokenized_titles and isinstance(self._tokenized_titles[0], list):
-                import itertools
-                self._tokenized_titles = [t_ for t_ in itertools.chain(*self._tokenized_titles)]
-            # --- temp data fix {end} --- tokenizedMajors[0] is a list
-        # calculate title vectors
-        self._title_vectors = []
-        for title_ in self._tokenized_titles:
-            self._title_vectors.append(get_industries_title_vector(title_))
-        # load experiences
-        self._best_company_class = -1
-        for exp in talent_dict.get('experiences', []):
+            languages.add(language)
+        return languages
+
+    @lazy_slot
+    def skills_in_title(self):
+        """
+        languages mentioned in the titles, e.g. JAVA in "java developer"
+        """
+        titles = [t_.lower() for t_ in Doc.tokenized_titles.func(self)]
+        return {l_ for l_ in self.languages if any(l_.replace('_', ' ').lower() in t_ for t_ in titles)}
+
+    @lazy_slot
+    def title_vectors(self):
+        from lib.utils.wordvecs_provider import get_industries_title_vector
+        return [get_industries_title_vector(title_) for title_ in self.tokenized_titles]
+
+    @lazy_slot
+    def highest_degree_score(self):
+        if (highest_degree_score := self._source.get('highestDegreeScore', np.nan)) is None:
+            return np.nan
+        return highest_degree_score
+
+    @lazy_slot
+    def best_company_class(self):
+        best_company_class = -1
+        for exp in self._source.get('experiences', []):
             # famous_company meaning:
             # -1: not found in wiki
             # 0: not famous
             # 1: famous
-            # --- tmp code, remove after data refreshed ---{end}
             famous_company = exp.get('companyInfo', {}).get('isFamousCompany', -1)
-            if famous_company > self._best_company_class:
-                self._best_company_class = 1 if famous_company else 0
+            if famous_company > best_company_class:
+                best_company_class = 1 if famous_company else 0
+        return best_company_class
 
-        # load posting date
-        self._posting_date, self._last_modified_date = None, None
-        created_date_string = talent_dict.get('createdDate', None)
+    @lazy_slot
+    def dates(self):
+        """
+        :return: (posting date, last modified date)
+        """
+        posting_date, last_modified_date = None, None
+        created_date_string = self._source.get('createdDate', None)
         try:
             # last modified date might be the last status change date of the job
             if created_date_string:
-                self._posting_date = datetime.strptime(created_date_string, '%Y-%m-%dT%H:%M:%SZ')
-            if self._last_modified_date_string:
-                self._last_modified_date = datetime.strptime(self._last_modified_date_string,
-                                                             '%Y-%m-%dT%H:%M:%SZ')
-                if not self._posting_date:
-                    self._posting_date = self._last_modified_date
+                posting_date = datetime.strptime(created_date_string, '%Y-%m-%dT%H:%M:%SZ')
+            if self.last_modified_date_str:
+                last_modified_date = datetime.strptime(self.last_modified_date_str, '%Y-%m-%dT%H:%M:%SZ')
+                if not posting_date:
+                    posting_date = last_modified_date
         except ValueError:
-            logger.error(f'Cannot read {talent.get("_index", "???")}/{talent.get("_id", "???")}'
-                         f' created/lastModified date: {created_date_string}/{self._last_modified_date_string}')
+            logger.error(f'Cannot read {self._index}/{self._id}'
+                         f' created/lastModified date: {created_date_string}/{self.last_modified_date_str}')
+        return posting_date, last_modified_date
 
-        self._current_career_years = np.NaN
+    @lazy_slot
+    def current_career_years(self):
         # todo remove old key recentExperienceStartDate
+        start_date = self._source.get('recentExperienceStartDate', self._source.get('recentJobFunctionStartDate', None))
         try:
-            self._current_career_years = (date_ -
-                                          datetime.strptime(talent_dict.get('recentExperienceStartDate', talent_dict.get('recentJobFunctionStartDate', None)),
-                                                            '%Y-%m-%d')
-                                          ).days / 365
+            return (self._date - datetime.strptime(start_date, '%Y-%m-%d')).days / 365
         except ValueError:
-            logger.error(f"Cannot read recentJobFunctionStartDate:"
-                         f"{talent.get('recentJobFunctionStartDate', None)} as date.")
+            logger.error(f"Cannot read recentJobFunctionStartDate:{start_date} as date.")
         except TypeError:
             # if no experience, it means 0 year
-            if 'experiences' not in talent_dict:
-                self._current_career_years = 0
+            if 'experiences' not in self._source:
+                return 0
             # if there is experience but start date is not specified, this value is unavailable
+        return np.nan
 
-        # get education information
+    @lazy_slot
+    def educations(self):
+        """
+        :return: (best university rank, highest education)
+        """
         highest_education = None
-        self._best_university_rank = MAX_UNIV_RANK
-        for edu in talent_dict.get('educations', []):
+        best_university_rank = max_univ_rank()
+        for edu in self._source.get('educations', []):
             # --- tmp code, remove after data refreshed ---{start}
             university_rank = edu.get('collegeWorldRank', None)
             if not university_rank:
                 # --- tmp code, remove after data refreshed ---{end}
                 university_rank = edu.get('collegeInfo', {}).get('collegeWorldRank', None)
-            if university_rank and university_rank < self._best_university_rank:
-                self._best_university_rank = university_rank
+            if university_rank and university_rank < best_university_rank:
+                best_university_rank = university_rank
             if highest_education:
                 continue
             highest_education = edu
+        return best_university_rank, highest_education
 
+    @lazy_slot
+    def view(self):
+        from configs.view_keys import TALENT_VIEW_KEYS
+        view = Doc.view.func(self)
         # load the columns shown on UI
         for k in TALENT_VIEW_KEYS:
-            if v := talent_dict.get(k, None):
-                self._view[k] = list(self._skill_dict.keys()) if k == 'skills' else v
-        if highest_education:
+            if v := self._source.get(k, None):
+                view[k] = list(self.skill_dict.keys()) if k == 'skills' else v
+        if highest_education := self.educations[1]:
             major_names = highest_education.get('majorName', '')
             if isinstance(major_names, list) and major_names:
-                highest_education['majorName'] = '|'.join(major_names)
-            self._view['highestEducation'] = highest_education
+                # copied, _source is left as it is
+                highest_education = dict(highest_education, majorName='|'.join(major_names))
+            view['highestEducation'] = highest_education
+        return view
 
     @property
     def posting_days(self):
@@ -127,7 +165,7 @@ class Talent(Doc):
         :return:
         """
         if not self.posting_date:
-            return np.NaN
+            return np.nan
         else:
             posting_days = (self.investigating_date - self.posting_date).days
             return posting_days if posting_days > 0 else 0
@@ -138,36 +176,70 @@ class Talent(Doc):
 
     @property
     def from_common_db(self):
-        return self._from_common_db
-
-    @property
-    def title_vectors(self):
-        return self._title_vectors
-
-    @property
-    def highest_degree_score(self):
-        return self._highest_degree_score
+        from libquerynormalization.configs.environments import COMMON_DB_INDEX
+        return self._index == COMMON_DB_INDEX
 
     @property
     def posting_date(self):
-        return self._posting_date
-
-    @property
-    def university_rank(self):
-        return self._best_university_rank
-
-    @property
-    def best_company_class(self):
-        return self._best_company_class
-
-    @property
-    def current_career_years(self):
-        return self._current_career_years
+        return self.dates[0]
 
     @property
-    def last_modified_date_str(self) -> str:
-        return self._last_modified_date_string
+    def last_modified_date(self):
+        return self.dates[1]
 
     @property
-    def languages(self):
-        return self._languages
+    def university_rank(self):
+        return self.educations[0]
+
+
+def talent_features(talents, date_: datetime):
+    """
+    the TALENT_FEATURES of many talents at once, same values as the Talent properties
+    the sources are only read in python, dates are parsed and NaNs filled column-wise
+    :param talents: raw objects gotten from Elastic get and search APIs
+    :param date_: investigating date
+    :return: pandas.DataFrame of TALENT_FEATURES indexed by the talent _id
+    """
+    ids, created, last_modified, career_start, no_experience, degree_scores = [], [], [], [], [], []
+    # (talent position, value) of every education rank and experience company class
+    rank_owners, ranks, company_owners, company_classes = [], [], [], []
+    for i_, talent in enumerate(talents):
+        ids.append(str(talent.get('_id')))
+        source = talent.get('_source', talent)
+        created.append(source.get('createdDate', None))
+        last_modified.append(source.get('lastModifiedDate', None))
+        # todo remove old key recentExperienceStartDate
+        career_start.append(source.get('recentExperienceStartDate', source.get('recentJobFunctionStartDate', None)))
+        no_experience.append('experiences' not in source)
+        degree_scores.append(source.get('highestDegreeScore', None))
+        for edu in source.get('educations', []):
+            if rank_ := edu.get('collegeWorldRank', None) or edu.get('collegeInfo', {}).get('collegeWorldRank', None):
+                rank_owners.append(i_)
+                ranks.append(rank_)
+        for exp in source.get('experiences', []):
+            company_owners.append(i_)
+            company_classes.append(exp.get('companyInfo', {}).get('isFamousCompany', -1))
+    date_ = pd.Timestamp(date_)
+    # the posting date is the created date, the last modified one if missing; an unreadable created date gives none
+    posting_date = pd.to_datetime(pd.Series(created), format='%Y-%m-%dT%H:%M:%SZ', errors='coerce')
+    missing = np.array([not c_ for c_ in created], dtype=bool)
+    posting_date[missing] = pd.to_datetime(pd.Series(last_modified), format='%Y-%m-%dT%H:%M:%SZ',
+                                           errors='coerce')[missing]
+    posting_days = (date_ - posting_date).dt.days.clip(lower=0)
+    career_start = pd.Series(career_start, dtype=object)
+    current_career_years = (date_ - pd.to_datetime(career_start, format='%Y-%m-%d', errors='coerce')).dt.days / 365
+    # if no experience, it means 0 year
+    current_career_years[career_start.isna().to_numpy() & np.array(no_experience, dtype=bool)] = 0
+    university_rank = np.full(len(ids), max_univ_rank(), dtype=np.float64)
+    np.minimum.at(university_rank, np.array(rank_owners, dtype=np.intp), np.array(ranks, dtype=np.float64))
+    # -1: not found in wiki, 0: not famous, 1: famous
+    best_company_class = np.full(len(ids), -1, dtype=np.int8)
+    np.maximum.at(best_company_class, np.array(company_owners, dtype=np.intp),
+                  np.array(company_classes, dtype=np.int8))
+    return pd.DataFrame({
+        'posting_days': posting_days.to_numpy(dtype=np.float64, na_value=np.nan),
+        'current_career_years': current_career_years.to_numpy(dtype=np.float64, na_value=np.nan),
+        'university_rank': university_rank,
+        'best_company_class': np.minimum(best_company_class, 1),
+        'highest_degree_score': pd.to_numeric(pd.Series(degree_scores, dtype=object), errors='coerce').to_numpy(),
+    }, index=pd.Index(ids, name='_id'), columns=TALENT_FEATURES)
@@ -0,0 +1,180 @@
+import time
+import pprint
+import threading
+from itertools import islice
+from collections import OrderedDict, Counter
+from concurrent.futures import Future
+from lib.metrics import METRICS
+from lib.lazy import lazy_logger
+pp = pprint.PrettyPrinter(indent=4, width=200)
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+MGET_BATCH_SIZE = 1000
+
+
+def fill_job(apn, es_filler, job_id):
+    METRICS.count('refills.job')
+    job_apn_json = apn.get_job_v2(job_id)
+    job_filled = es_filler.fill_job(job_apn_json, job_id)
+    return {"_id": "dummy", "_index": "dummy", "_source": job_filled}
+
+
+def fill_talent(apn, es_filler, talent_id):
+    METRICS.count('refills.talent')
+    talent_apn_json = apn.get_talent_v2(talent_id)
+    try:
+        talent_filled = es_filler.fill_talent(talent_apn_json, talent_id)
+    except Exception as e:
+        pp.pprint(talent_apn_json)
+        raise e
+    with METRICS.timer('filler.refresh_wait'):
+        time.sleep(1)
+    return talent_filled
+
+
+class DocResolver:
+    """
+    reads ahead a window of rows and resolves their distinct jobs and talents with one mget per index,
+    broken docs (with an "error" key) are deleted and refilled like missing ones
+    jobs stay in a LRU cache across windows, a talent is kept until every pending row using it is consumed
+    """
+    def __init__(self, es, apn, es_filler, tenant_id, job_cache_size=10000):
+        self._es = es
+        self._apn = apn
+        self._es_filler = es_filler
+        self._job_index = 'jobs_' + tenant_id
+        self._talent_index = 'talents_' + tenant_id
+        self._job_cache_size = job_cache_size
+        self._jobs = OrderedDict()    # job_id -> hit, None if missing in ES
+        self._talents = {}            # talent_id -> _source, None if missing in ES
+        self._talent_refs = Counter()  # talent_id -> number of pending rows
+        self._filling = {}            # (index, id) -> Future of the fill
+        self._lock = threading.Lock()
+        self.mget_requests = 0
+
+    def read_ahead(self, rows, window=500, skip=None):
+        """
+        :param rows: iterable of rows with job_id and talent_id
+        :param window: number of rows resolved by one mget per index
+        :param skip: skip(row) is True for the rows which will not be checked, they are yielded but not resolved
+        :return: generator of the same rows, a window is resolved before its first row is yielded
+        """
+        rows = iter(rows)
+        while chunk := list(islice(rows, window)):
+            self.prefetch([r_ for r_ in chunk if not skip(r_)] if skip else chunk)
+            yield from chunk
+
+    def prefetch(self, rows):
+        with self._lock:
+            job_ids = {str(r_.job_id) for r_ in rows} - self._jobs.keys()
+            talent_ids = set()
+            for r_ in rows:
+                id_ = str(r_.talent_id)
+                if id_ not in self._talents:
+                    talent_ids.add(id_)
+                self._talent_refs[id_] += 1
+        jobs = self.__mget(self._job_index, job_ids)
+        talents = self.__mget(self._talent_index, talent_ids)
+        with self._lock:
+            for id_, hit_ in jobs.items():
+                self.__cache_job(id_, hit_)
+            for id_, hit_ in talents.items():
+                self._talents[id_] = hit_['_source'] if hit_ else None
+
+    def __mget(self, index_, ids):
+        """
+        :return: {id: hit}, hit is None for the missing and broken docs
+        """
+        ids = sorted(ids)
+        docs = {}
+        for start in range(0, len(ids), MGET_BATCH_SIZE):
+            with METRICS.timer('es.mget'):
+                response = self._es.mget(index=index_, body={"ids": ids[start:start + MGET_BATCH_SIZE]})
+            self.mget_requests += 1
+            for hit_ in response['docs']:
+                if not hit_.get('found', False):
+                    docs[hit_['_id']] = None
+                elif 'error' in hit_['_source']:
+                    logger.warning(f"{index_}/{hit_['_id']} - {hit_['_source']} doc broken")
+                    METRICS.count('broken_docs')
+                    self._es.delete(index_, hit_['_id'])
+                    docs[hit_['_id']] = None
+                else:
+                    docs[hit_['_id']] = hit_
+        return docs
+
+    def __cache_job(self, id_, hit_):
+        self._jobs[id_] = hit_
+        self._jobs.move_to_end(id_)
+        while len(self._jobs) > self._job_cache_size:
+            self._jobs.popitem(last=False)
+
+    def __fill_once(self, index_, id_, fill):
+        """
+        rows of the same window share one fill of a missing doc, even when they are checked concurrently
+        """
+        with self._lock:
+            if future_ := self._filling.get((index_, id_)):
+                owner = False
+            else:
+                future_ = self._filling[(index_, id_)] = Future()
+                owner = True
+        if not owner:
+            return future_.result()
+        try:
+            result = fill()
+            future_.set_result(result)
+            return result
+        except Exception as e:
+            future_.set_exception(e)
+            raise e
+        finally:
+            with self._lock:
+                self._filling.pop((index_, id_), None)
+
+    def __fill_job(self, job_id):
+        j_ = fill_job(self._apn, self._es_filler, job_id)
+        with self._lock:
+            self.__cache_job(str(job_id), j_)
+        return j_
+
+    def __fill_talent(self, talent_id):
+        talent_ = fill_talent(self._apn, self._es_filler, talent_id)
+        with self._lock:
+            # the later rows of the same talent use the filled doc
+            if str(talent_id) in self._talent_refs:
+                self._talents[str(talent_id)] = talent_
+        return talent_
+
+    def get_job(self, job_id):
+        id_ = str(job_id)
+        with self._lock:
+            cached = id_ in self._jobs
+            if j_ := self._jobs.get(id_):
+                self._jobs.move_to_end(id_)
+        if j_:
+            METRICS.count('resolver.job_hits')
+            return j_
+        if not cached:
+            # not prefetched, e.g. evicted from the cache
+            if j_ := self.__mget(self._job_index, [id_])[id_]:
+                with self._lock:
+                    self.__cache_job(id_, j_)
+                return j_
+        return self.__fill_once(self._job_index, id_, lambda: self.__fill_job(job_id))
+
+    def get_talent(self, talent_id):
+        id_ = str(talent_id)
+        with self._lock:
+            cached = id_ in self._talents
+            talent_ = self._talents.get(id_)
+            if self._talent_refs[id_] > 1:
+                self._talent_refs[id_] -= 1
+            else:
+                self._talent_refs.pop(id_, None)
+                self._talents.pop(id_, None)
+        if talent_:
+            METRICS.count('resolver.talent_hits')
+            return talent_
+        if not cached and (t_ := self.__mget(self._talent_index, [id_])[id_]):
+            return t_['_source']
+        return self.__fill_once(self._talent_index, id_, lambda: self.__fill_talent(talent_id))
@@ -0,0 +1,109 @@
+import json
+import zlib
+import threading
+from collections import OrderedDict
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+
+
+def doc_version(j_):
+    """
+    version of an ES hit, the checksum of its _source when ES does not tell (e.g. filled docs)
+    """
+    if (version := j_.get('_seq_no', j_.get('_version', None))) is not None:
+        return version
+    return zlib.crc32(json.dumps(j_['_source'], sort_keys=True, default=str).encode('utf-8'))
+
+
+class JobCacheEntry:
+    """
+    a built Job, its required conditions and the ES DSL compiled from them
+    """
+    def __init__(self, cache, key, job, conditions, size):
+        self._cache = cache
+        self.key = key
+        self.job = job
+        self.conditions = conditions
+        self.size = size
+        self._compiled = {}
+
+    def compiled(self, key, compile_):
+        """
+        :param key: identifies the condition subset, e.g. ids of its conditions
+        :param compile_: builds the ES DSL of the subset on miss
+        :return: memoized compile_()
+        """
+        if (dsl := self._compiled.get(key, None)) is not None:
+            self._cache.count('compile_hits')
+            return dsl
+        self._cache.count('compile_misses')
+        dsl = self._compiled[key] = compile_()
+        self._cache.grow(self, len(json.dumps(dsl, default=str)))
+        return dsl
+
+
+class JobCache:
+    """
+    LRU cache of JobCacheEntry by (job id, doc version), bounded by number of entries and by estimated bytes
+    """
+    SOURCE_SIZE_FACTOR = 4  # python objects of a job take several times its json size
+
+    def __init__(self, max_entries=1000, max_bytes=256 * 1024 * 1024):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'compile_hits': 0, 'compile_misses': 0}
+
+    def get(self, job_id, j_):
+        """
+        :param j_: ES hit of the job
+        :return: JobCacheEntry, built on miss
+        """
+        key = (str(job_id), doc_version(j_))
+        with self._lock:
+            if entry := self._entries.get(key, None):
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+            self._stats['misses'] += 1
+        from lib.datatype.job import Job
+        job = Job(j_)
+        conditions = job.get_required_conditions()
+        entry = JobCacheEntry(self, key, job, conditions,
+                              len(json.dumps(j_['_source'], default=str)) * self.SOURCE_SIZE_FACTOR)
+        with self._lock:
+            if key in self._entries:
+                # built concurrently by another row
+                return self._entries[key]
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self.__evict()
+        return entry
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def grow(self, entry, size):
+        with self._lock:
+            entry.size += size
+            # an evicted entry can still be in use by the rows being checked
+            if self._entries.get(entry.key, None) is entry:
+                self._bytes += size
+                self.__evict()
+
+    def __evict(self):
+        while self._entries and (len(self._entries) > self._max_entries or self._bytes > self._max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._stats['evictions'] += 1
+
+    @property
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        if lookups := stats['hits'] + stats['misses']:
+            stats['hit_rate'] = stats['hits'] / lookups
+        return stats
@@ -1,26 +1,57 @@
 import json
+from functools import lru_cache
 from libsearcher.pylibshared.enumerations.degrees import degree_regulator
 from libsearcher.pylibshared.enumerations.languages import extract_languages
 from libsearcher.pylibshared.enumerations.levels import JobExperienceLevels, maxsize
-from libsearcher.pylibshared.utils.logger import get_logger
-logger = get_logger(__name__, 'INFO', to_file=True, to_stdout=True)
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, 'INFO', to_file=True, to_stdout=True)
+KEYWORD_CACHE_SIZE = 100000
+
+
+@lru_cache(maxsize=KEYWORD_CACHE_SIZE)
+def classify_keyword(k_):
+    """
+    the same keywords repeat across jobs, their classification is memoized
+    :param k_: stripped keyword
+    :return: (degree, language names, skill), only one of them is set
+    """
+    d_, _, _ = degree_regulator(k_)
+    if d_:
+        return d_, (), None
+    if langs_ := extract_languages(k_):
+        return None, tuple(lang_.name for lang_ in langs_), None
+    return None, (), k_
 
 
 def separate_keywords(keys):
     degrees, langs, skills = [], [], []
     for k_ in keys:
-        k_ = k_.strip()
-        d_, _, _ = degree_regulator(k_)
+        d_, langs_, skill_ = classify_keyword(k_.strip())
         if d_:
             degrees.append(d_)
-        elif langs_ := extract_languages(k_):
-            for lang_ in langs_:
-                langs.append(lang_.name)
+        elif langs_:
+            langs.extend(langs_)
         else:
-            skills.append(k_)
+            skills.append(skill_)
     return degrees, langs, skills
 
 
+def match_skills(keywords, skill_index):
+    """
+    :param skill_index: {skillName: skill object}, see job_v1_to_v2
+    :return: skill objects of the keywords, a bare {'skillName': keyword} for the ones without object
+    """
+    matched = []
+    for k_ in keywords:
+        if (skill := skill_index.get(k_, None)) is not None:
+            skill.pop('id', None)
+            skill.pop('necessity', None)
+            matched.append(skill)
+        else:
+            matched.append({'skillName': k_})
+    return matched
+
+
 def get_list(raw: str):
     if not raw:
         return []
@@ -73,9 +104,12 @@ def job_v1_to_v2(doc):
     for skill_obj in skills:
         if (score := skill_obj.get('score', -1)) > max_skill_score:
             max_skill_score = score
+    skill_index = {}
     for skill_obj in skills:
         if score := skill_obj.get('score', None):
             skill_obj['score'] = score / max_skill_score
+        # the first skill object of a name is matched, like a linear scan would
+        skill_index.setdefault(skill_obj.get('skillName', None), skill_obj)
     degrees = []
     for s_ in doc.get('preferredDegrees', []) + [doc.get('minimumDegree', None)]:
         d, _, _ = degree_regulator(s_)
@@ -84,29 +118,14 @@ def job_v1_to_v2(doc):
     if r_keys_ := get_list(doc.pop('requiredKeywords', [])):
         degrees_, r_langs, r_skills = separate_keywords(r_keys_)
         degrees_.extend(degrees_)
-        for r_skill in r_skills:
-            for skill in skills:
-                if skill['skillName'] == r_skill:
-                    skill.pop('id')
-                    skill.pop('necessity')
-                    required_skills.append(skill)
-                    break
-            else:
-                required_skills.append({'skillName': r_skill})
+        required_skills = match_skills(r_skills, skill_index)
         if r_langs:
             doc['requiredLanguages'] = doc.get('requiredLanguages', []) + r_langs
     if keys_ := get_list(doc.pop('keywords', [])):
-        degrees_, p_langs, p_skills = separate_keywords([k for k in keys_ if k not in r_keys_])
+        r_keys_set = set(r_keys_)
+        degrees_, p_langs, p_skills = separate_keywords([k for k in keys_ if k not in r_keys_set])
         degrees.extend(degrees_)
-        for p_skill in p_skills:
-            for skill in skills:
-                if skill['skillName'] == p_skill:
-                    skill.pop('id')
-                    skill.pop('necessity')
-                    preferred_skills.append(skill)
-                    break
-            else:
-                preferred_skills.append({'skillName': p_skill})
+        preferred_skills = match_skills(p_skills, skill_index)
         if p_langs:
             doc['preferredLanguages'] = doc.get('preferredLanguages', []) + p_langs
     if required_skills:
@@ -177,3 +196,13 @@ def job_v1_to_v2(doc):
     if s_ := doc.pop('jdText', None):
         doc['text'] = s_
     return doc
+
+
+def jobs_v1_to_v2(docs):
+    """
+    job_v1_to_v2 of many jobs, e.g. a whole harvest, sharing the keyword classification cache
+    :return: generator of the converted docs
+    """
+    for doc in docs:
+        yield job_v1_to_v2(doc)
+    logger.debug("Keyword classification cache: %s", classify_keyword.cache_info())
@@ -0,0 +1,65 @@
+import threading
+
+
+class Lazy:
+    """
+    proxy of an object created by factory() on its first attribute access,
+    e.g. ES clients and loggers which should not be built (nor their packages imported) at import time
+    """
+    __slots__ = ('_factory', '_obj', '_lock')
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+        return self._obj
+
+    def reset(self):
+        """
+        drop the created object, e.g. in a forked worker which needs its own connections
+        """
+        with self._lock:
+            self._obj = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def lazy_logger(name, *args, **kwargs):
+    """
+    libsearcher get_logger(name, *args, **kwargs) on first use, with the level and queue set by lib.log.configure,
+    importing libsearcher.pylibshared loads the whole libsearcher package
+    """
+    def create():
+        from libsearcher.pylibshared.utils.logger import get_logger
+        from lib.log import setup
+        return setup(get_logger(name, *args, **kwargs))
+    return Lazy(create)
+
+
+class lazy_slot:
+    """
+    cached property for classes with __slots__: computed on first access and kept in the slot '_' + name,
+    which must be declared in __slots__
+    an override reusing the parent computation calls Parent.name.func(self), super().name would fill the slot
+    """
+    def __init__(self, func):
+        self.func = func
+        self._slot = '_' + func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self._slot)
+        except AttributeError:
+            value = self.func(obj)
+            setattr(obj, self._slot, value)
+            return value
@@ -0,0 +1,169 @@
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+# module name prefix -> level, e.g. {'': 'INFO', 'lib.datatype': 'WARNING'}, applied to the loggers created after
+_levels = {}
+_lock = threading.Lock()
+_listener = None
+_dispatcher = None
+_queue = None
+# listeners of the queues the worker processes write to, see listen
+_listeners = []
+
+
+def parse_levels(specs):
+    """
+    :param specs: e.g. ['INFO', 'lib.datatype=WARNING', 'lib.connectors=DEBUG'], a bare level sets the default
+    :return: {module name prefix: level}
+    """
+    levels = {}
+    for spec in specs or ():
+        name, _, level = spec.rpartition('=')
+        if not isinstance(logging.getLevelName(level.upper()), int):
+            raise ValueError(f"Unknown log level {level} in {spec}")
+        levels[name] = level.upper()
+    return levels
+
+
+def level_of(name):
+    """
+    :return: level of the longest configured prefix of the module name, None if not configured
+    """
+    for prefix in sorted(_levels, key=len, reverse=True):
+        if not prefix or name == prefix or name.startswith(prefix + '.'):
+            return _levels[prefix]
+    return None
+
+
+class _Dispatcher(logging.Handler):
+    """
+    hands the records of the queue to the original handlers of their logger, on the listener thread
+    """
+    def __init__(self):
+        super().__init__()
+        self.handlers = {}
+
+    def handle(self, record):
+        if (handlers := self.handlers.get(record.name)) is None:
+            handlers = self.__adopt(record.name)
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def __adopt(self, name):
+        """
+        :return: handlers of a logger only created by a worker process, created here the same way,
+                 as all the loggers of lib and data_harvester are
+        """
+        from lib.lazy import lazy_logger
+        lazy_logger(name, debug_level='DEBUG', to_file=True, to_stdout=True).get()
+        # a logger without handlers of its own writes through its parents, which are not queued
+        return self.handlers.setdefault(name, logging.getLogger(name).handlers)
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    only merges the message with its arguments on the calling thread,
+    the formatting and the writes to the file and stdout are left to the listener
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # the traceback is rendered now, the frames would be gone once the queue is drained
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure(levels=None, use_queue=False):
+    """
+    :param levels: {module name prefix: level}, see parse_levels
+    :param use_queue: loggers write through a queue drained by one background thread
+    call it before the loggers are used, they are created by lazy_logger on first use
+    """
+    global _listener, _dispatcher, _queue
+    with _lock:
+        _levels.clear()
+        _levels.update(levels or {})
+        if use_queue and _listener is None:
+            _queue = queue.SimpleQueue()
+            _dispatcher = _Dispatcher()
+            _listener = QueueListener(_queue, _dispatcher)
+            _listener.start()
+            atexit.register(stop)
+
+
+def setup(logger):
+    """
+    applies the configured level and queue to a logger created by get_logger,
+    a logger without handlers of its own is left writing through its parents
+    """
+    if (level := level_of(logger.name)) is not None:
+        logger.setLevel(level)
+    with _lock:
+        if _listener is None or not logger.handlers or any(isinstance(h_, QueueHandler) for h_ in logger.handlers):
+            return logger
+        _dispatcher.handlers[logger.name] = list(logger.handlers)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(_LazyQueueHandler(_queue))
+    return logger
+
+
+def listen(queue_):
+    """
+    in the main process: write the records a worker process sends to queue_ (a multiprocessing queue),
+    by the handlers of the loggers of the same names here, see forward
+    """
+    if _listener is None:
+        raise RuntimeError("configure(use_queue=True) must be called before listen")
+    listener = QueueListener(queue_, _dispatcher)
+    listener.start()
+    with _lock:
+        _listeners.append(listener)
+
+
+def forward(queue_):
+    """
+    in a worker process forked after configure(use_queue=True): the queued loggers write to queue_,
+    drained by listen in the main process, instead of the queue whose listener thread was not forked
+    """
+    global _queue
+    with _lock:
+        if _listener is None:
+            raise RuntimeError("configure(use_queue=True) must be called before forking the workers")
+        _queue = queue_
+        for name in _dispatcher.handlers:
+            for handler in logging.getLogger(name).handlers:
+                if isinstance(handler, _LazyQueueHandler):
+                    handler.queue = queue_
+
+
+def stop():
+    """
+    writes the queued records and stops the background thread
+    """
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+        listeners = _listeners[:]
+        _listeners.clear()
+    if listener is None:
+        return
+    # the records of the workers are written first, the workers have stopped by now
+    for listener_ in listeners:
+        listener_.stop()
+    # the loggers write on the calling thread again, e.g. the records of atexit callbacks
+    with _lock:
+        for name, handlers in _dispatcher.handlers.items():
+            logger = logging.getLogger(name)
+            for handler in [h_ for h_ in logger.handlers if isinstance(h_, _LazyQueueHandler)]:
+                logger.removeHandler(handler)
+            for handler in handlers:
+                logger.addHandler(handler)
+    # then the records still queued are written by their original handlers
+    listener.stop()
+    _dispatcher.handlers.clear()
@@ -0,0 +1,202 @@
+import copy
+import json
+import math
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+# upper bounds in seconds growing by 10% from 10us to about 1h: a quantile read as the upper bound of its bucket
+# is at most 10% above the observed value
+BUCKETS = tuple(1e-5 * 1.1 ** k_ for k_ in range(210))
+PROMETHEUS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+
+class Histogram:
+    """
+    counts of the observed seconds per bucket of BUCKETS, constant memory whatever the number of observations,
+    and per bucket of PROMETHEUS_BUCKETS, whose bounds are not bounds of BUCKETS
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.prometheus_counts = [0] * (len(PROMETHEUS_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.prometheus_counts[bisect_left(PROMETHEUS_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """
+        :return: upper bound of the bucket holding the q-quantile, capped by the max observed
+        """
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for k_, n_ in enumerate(self.counts):
+            seen += n_
+            if seen >= rank and n_:
+                return min(BUCKETS[k_], self.max) if k_ < len(BUCKETS) else self.max
+        return self.max
+
+    def cumulative(self):
+        """
+        :return: [(bound, number of observations <= bound), ...] of PROMETHEUS_BUCKETS
+        """
+        result, seen = [], 0
+        for bound, n_ in zip(PROMETHEUS_BUCKETS, self.prometheus_counts):
+            seen += n_
+            result.append((bound, seen))
+        return result
+
+    def merge(self, other):
+        self.counts = [a_ + b_ for a_, b_ in zip(self.counts, other.counts)]
+        self.prometheus_counts = [a_ + b_ for a_, b_ in zip(self.prometheus_counts, other.prometheus_counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else math.nan,
+                'p50': self.quantile(.5), 'p95': self.quantile(.95), 'p99': self.quantile(.99), 'max': self.max}
+
+
+class Metrics:
+    """
+    seconds per stage (e.g. es.get_doc, apn.talent, filler.talent, es.count), counters (e.g. broken_docs, refills)
+    and the number of harvested rows, whose rate is logged every report_interval seconds
+    """
+    def __init__(self, report_interval=60.):
+        self.report_interval = report_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+            self._rows = 0
+            self._start = self._last_report = time.perf_counter()
+            self._last_rows = 0
+
+    def observe(self, stage, seconds):
+        if (tracked := getattr(self._local, 'tracked', None)) is not None:
+            tracked[stage] = tracked.get(stage, 0.) + seconds
+        with self._lock:
+            if (histogram := self._stages.get(stage)) is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def track(self):
+        """
+        also sum the seconds of the stages observed by the calling thread within, e.g. those of one row
+        :return: context manager giving the {stage: seconds} being summed
+        """
+        previous, tracked = getattr(self._local, 'tracked', None), {}
+        self._local.tracked = tracked
+        try:
+            yield tracked
+        finally:
+            self._local.tracked = previous
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def merge(self, prefix, counters):
+        """
+        set the counters kept by another object, e.g. merge('job_cache', job_cache.stats), ratios are left out
+        """
+        with self._lock:
+            for k_, v_ in counters.items():
+                if isinstance(v_, int):
+                    self._counters[f"{prefix}.{k_}"] = v_
+
+    def snapshot(self):
+        """
+        :return: picklable copy of the stages and counters, e.g. sent by a worker process to be absorbed
+        """
+        with self._lock:
+            return {'stages': {k_: copy.deepcopy(h_) for k_, h_ in self._stages.items()},
+                    'counters': dict(self._counters)}
+
+    def absorb(self, snapshot):
+        """
+        add the stages and counters of a snapshot, the rows are not, they are counted where they are written
+        """
+        with self._lock:
+            for k_, h_ in snapshot['stages'].items():
+                if (histogram := self._stages.get(k_)) is None:
+                    histogram = self._stages[k_] = Histogram()
+                histogram.merge(h_)
+            for k_, v_ in snapshot['counters'].items():
+                self._counters[k_] = self._counters.get(k_, 0) + v_
+
+    def row(self, n=1):
+        """
+        count harvested rows, the rows/sec line is logged by the row passing report_interval
+        """
+        with self._lock:
+            self._rows += n
+            now = time.perf_counter()
+            if now - self._last_report < self.report_interval:
+                return
+            rows, elapsed = self._rows, now - self._start
+            rate = (rows - self._last_rows) / (now - self._last_report)
+            self._last_report, self._last_rows = now, rows
+        logger.info(f"{rows} rows in {elapsed:.0f}s: {rate:.2f} rows/sec lately, {rows / elapsed:.2f} overall")
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            return {'rows': self._rows, 'seconds': elapsed, 'rows_per_sec': self._rows / elapsed if elapsed else 0.,
+                    'counters': dict(self._counters),
+                    'stages': {k_: h_.summary() for k_, h_ in sorted(self._stages.items())}}
+
+    def prometheus(self, prefix='harvester'):
+        """
+        :return: Prometheus text exposition of the rows, counters and stage histograms
+        """
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_rows_total counter", f"{prefix}_rows_total {summary['rows']}",
+                 f"# TYPE {prefix}_events_total counter"]
+        lines.extend(f'{prefix}_events_total{{name="{k_}"}} {v_}' for k_, v_ in sorted(summary['counters'].items()))
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        with self._lock:
+            stages = [(k_, h_.cumulative(), h_.count, h_.sum) for k_, h_ in self._stages.items()]
+        for stage, buckets, count, sum_ in sorted(stages):
+            lines.extend(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{b_}"}} {n_}' for b_, n_ in buckets)
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {sum_}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        the JSON summary to path.json and the Prometheus text to path.prom
+        """
+        with open(path + '.json', 'w', encoding='utf-8') as f_:
+            json.dump(self.summary(), f_, indent=2)
+        with open(path + '.prom', 'w', encoding='utf-8') as f_:
+            f_.write(self.prometheus())
+
+
+METRICS = Metrics()
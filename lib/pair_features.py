@@ -0,0 +1,126 @@
+import os
+import threading
+import numpy as np
+from lib.datatype.job import CONDITION_NAMES
+PAIR_FEATURES = tuple(f"{name}_passed" for name in CONDITION_NAMES) + (
+    'exp_below_min', 'exp_above_max', 'degree_score_delta', 'required_language_overlap',
+    'preferred_language_overlap', 'location_match')
+
+
+def condition_flags(job, unsatisfied_conditions):
+    """
+    :param unsatisfied_conditions: as reported by JobBatchChecker, None if the pair has passed check
+    :return: 1.0 passed, 0.0 failed, NaN if the job does not require it, for each of CONDITION_NAMES
+    """
+    failed = {id(c_) for c_ in unsatisfied_conditions or ()}
+    flags = []
+    for cond_ in job.required_conditions.values():
+        if cond_ is None:
+            flags.append(np.nan)
+        # an unsatisfied must collection is reported by its sub-conditions
+        elif id(cond_) in failed or any(id(c_) in failed for c_ in getattr(cond_, '_conditions', ())):
+            flags.append(0.)
+        else:
+            flags.append(1.)
+    return flags
+
+
+def overlap(required, owned):
+    return len(set(required) & owned) / len(required) if required else np.nan
+
+
+def job_pair_features(job, talents, failures):
+    """
+    the PAIR_FEATURES of one job with each of its talents
+    :param job: Job whose required_conditions have been checked
+    :param talents: [Talent, ...], their career years are counted up to their investigating date
+    :param failures: {talent id: unsatisfied conditions} of the talents which have not passed check
+    :return: float32 matrix, a row per talent
+    """
+    features = np.full((len(talents), len(PAIR_FEATURES)), np.nan, dtype=np.float32)
+    min_exp, max_exp = job.min_exp, job.max_exp
+    for k_, talent in enumerate(talents):
+        years = talent.current_career_years
+        features[k_] = condition_flags(job, failures.get(talent.id, None)) + [
+            max(min_exp - years, 0.) if min_exp == min_exp and years == years else np.nan,
+            max(years - max_exp, 0.) if max_exp == max_exp and years == years else np.nan,
+            talent.highest_degree_score - job.minimum_degree_score,
+            overlap(job.required_languages, talent.languages),
+            overlap(job.preferred_languages, talent.languages),
+            float(bool(job.country_codes & talent.country_codes)) if job.country_codes else np.nan,
+        ]
+    return features
+
+
+class PairFeatureWriter:
+    """
+    appends float32 rows of PAIR_FEATURES to a raw binary file, and their (i, talent_id, job_id) to path.keys,
+    the file is read back without loading it by open_pair_features
+    """
+    def __init__(self, path, batch_size=10000, resume=False):
+        """
+        :param resume: append to the files of the previous runs, otherwise they are started over
+        """
+        self._path = path
+        self._batch_size = batch_size
+        self._rows, self._keys = [], []
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path) and os.path.exists(path + '.keys'):
+            self.__truncate()
+        self._file = open(path, 'ab' if resume else 'wb')
+        self._keys_file = open(path + '.keys', 'a' if resume else 'w', encoding='utf-8')
+
+    def __truncate(self):
+        """
+        cut the files of an interrupted run back to the whole rows which have their keys, and the other way round
+        """
+        row_size = len(PAIR_FEATURES) * np.dtype(np.float32).itemsize
+        with open(self._path + '.keys', 'rb') as f_:
+            keys = f_.read()
+        # a torn last line has no newline
+        lines = keys.count(b'\n')
+        rows = min(os.path.getsize(self._path) // row_size, lines)
+        os.truncate(self._path, rows * row_size)
+        end = 0
+        for _ in range(rows):
+            end = keys.index(b'\n', end) + 1
+        os.truncate(self._path + '.keys', end)
+
+    def append(self, i, talent_id, job_id, features):
+        with self._lock:
+            self._rows.append(features)
+            self._keys.append(f"{i}\t{talent_id}\t{job_id}\n")
+            if len(self._rows) >= self._batch_size:
+                self.__flush()
+
+    def __flush(self):
+        if not self._rows:
+            return
+        np.asarray(self._rows, dtype=np.float32).reshape(-1, len(PAIR_FEATURES)).tofile(self._file)
+        self._keys_file.write(''.join(self._keys))
+        self._file.flush()
+        self._keys_file.flush()
+        self._rows.clear()
+        self._keys.clear()
+
+    def close(self):
+        with self._lock:
+            self.__flush()
+            self._file.close()
+            self._keys_file.close()
+
+
+def open_pair_features(path):
+    """
+    :return: (read-only np.memmap of shape (pairs, len(PAIR_FEATURES)), [(i, talent_id, job_id), ...])
+    """
+    row_size = len(PAIR_FEATURES) * np.dtype(np.float32).itemsize
+    if (size := os.path.getsize(path)) % row_size:
+        raise ValueError(f"{path} is not a matrix of {len(PAIR_FEATURES)} float32 columns: {size} bytes")
+    with open(path + '.keys', encoding='utf-8') as f_:
+        keys = [tuple(line.rstrip('\n').split('\t')) for line in f_]
+    if len(keys) != size // row_size:
+        raise ValueError(f"{path} has {size // row_size} rows but {len(keys)} keys")
+    if not keys:
+        return np.empty((0, len(PAIR_FEATURES)), dtype=np.float32), keys
+    return np.memmap(path, dtype=np.float32, mode='r', shape=(size // row_size, len(PAIR_FEATURES))), keys
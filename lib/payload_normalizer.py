@@ -0,0 +1,90 @@
+from environments import JOB_USELESS_KEYS, TALENT_USELESS_KEYS
+
+
+def _job_v1_to_v2(doc):
+    # the formatters load libsearcher, only when a conversion is needed
+    from lib.job_formatter import job_v1_to_v2
+    return job_v1_to_v2(doc)
+
+
+def _talent_v1_to_v2(doc):
+    from lib.talent_formatter import talent_v1_to_v2
+    return talent_v1_to_v2(doc)
+
+
+def is_empty(v):
+    # same as `v in (None, 'None', '', [], {})` without comparing v with every one of them
+    cls_ = v.__class__
+    if cls_ is str:
+        return v == '' or v == 'None'
+    if cls_ is dict or cls_ is list:
+        return not v
+    return v is None or (isinstance(v, (str, dict, list)) and v in ('None', '', [], {}))
+
+
+class PayloadNormalizer:
+    """
+    drops the useless keys at every level and the empty values (None, 'None', '', [], {}) and strips the strings,
+    iteratively and in place, then hands the document to finalize (e.g. the v1 -> v2 conversion) in the same pass
+    a dict or list becoming empty is dropped as well, strings are tested before being stripped
+    """
+    def __init__(self, useless_keys, finalize=None):
+        self._useless_keys = frozenset(useless_keys)
+        self._finalize = finalize
+
+    def finalize(self, data):
+        """
+        finalize a document normalized already, e.g. a cached one
+        """
+        return self._finalize(data) if self._finalize and data is not None else data
+
+    def __call__(self, data):
+        """
+        :param data: parsed json, modified in place
+        :return: the normalized data, None if nothing is left
+        """
+        if is_empty(data):
+            return None
+        if data.__class__ is str:
+            return data.strip()
+        if not isinstance(data, (dict, list)):
+            return data
+        useless_keys = self._useless_keys
+        # parents are always before their children
+        containers = [data]
+        for c_ in containers:
+            if isinstance(c_, dict):
+                if not useless_keys.isdisjoint(c_):
+                    for k_ in useless_keys.intersection(c_):
+                        del c_[k_]
+                values = c_.values()
+            else:
+                values = c_
+            for v_ in values:
+                if isinstance(v_, (dict, list)):
+                    containers.append(v_)
+        for c_ in reversed(containers):
+            if isinstance(c_, dict):
+                empty_keys = None
+                for k_, v_ in c_.items():
+                    if is_empty(v_):
+                        if empty_keys is None:
+                            empty_keys = [k_]
+                        else:
+                            empty_keys.append(k_)
+                    elif v_.__class__ is str:
+                        c_[k_] = v_.strip()
+                if empty_keys:
+                    for k_ in empty_keys:
+                        del c_[k_]
+            else:
+                c_[:] = [v_.strip() if v_.__class__ is str else v_ for v_ in c_ if not is_empty(v_)]
+        if not data:
+            return None
+        return self.finalize(data)
+
+
+JOB_NORMALIZER = PayloadNormalizer(JOB_USELESS_KEYS)
+TALENT_NORMALIZER = PayloadNormalizer(TALENT_USELESS_KEYS)
+JOB_V2_NORMALIZER = PayloadNormalizer(JOB_USELESS_KEYS, finalize=_job_v1_to_v2)
+TALENT_V2_NORMALIZER = PayloadNormalizer(TALENT_USELESS_KEYS, finalize=_talent_v1_to_v2)
@@ -0,0 +1,168 @@
+import io
+import sys
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+# a frame is attributed to the first stage whose pattern is in its filename (or cProfile function name),
+# the frames are looked at from the innermost one
+STAGES = (
+    ('formatting', ('payload_normalizer.py', 'job_formatter.py', 'talent_formatter.py')),
+    ('doc construction', ('datatype/',)),
+    ('io', ('requests/', 'urllib3/', 'elasticsearch/', 'http/client.py', 'socket', 'ssl', 'select', 'sqlite3',
+            'apn_cache.py', 'time.sleep')),
+)
+# libsearcher both builds the docs' searchers and compiles the conditions, its frames count only when no caller
+# in the stages above is found
+FALLBACK_STAGE = ('condition compilation', ('libsearcher/', 'job_cache.py'))
+# cProfile is built on sys.monitoring from 3.12: a single profile can be enabled at once, and it sees every thread
+PROCESS_WIDE_CPU = sys.version_info >= (3, 12)
+
+
+def stage_of(filenames):
+    """
+    :param filenames: of the frames, innermost first
+    :return: name of the stage, 'other' if none
+    """
+    fallback = False
+    for filename in filenames:
+        filename = filename.replace('\\', '/')
+        for stage, patterns in STAGES:
+            if any(p_ in filename for p_ in patterns):
+                return stage
+        fallback = fallback or any(p_ in filename for p_ in FALLBACK_STAGE[1])
+    return FALLBACK_STAGE[0] if fallback else 'other'
+
+
+class Profiler:
+    """
+    cpu: cProfile of a sample of the rows, each thread has its own profile which are merged at the end;
+         from Python 3.12 (PROCESS_WIDE_CPU) one profile over the whole loop, the sample does not apply
+    mem: tracemalloc over the whole loop, the sample does not apply since allocations are traced process-wide
+    the reports go to path.pstats (cpu) and path.txt, with the time or the allocations summed per stage
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure()
+
+    def configure(self, mode=None, path='profile', sample=1.0, top=25, nframes=25):
+        """
+        :param mode: 'cpu', 'mem' or None to disable
+        :param path: prefix of the reports, e.g. data/profile
+        :param sample: fraction of the rows profiled, e.g. 0.01 for one row in a hundred
+        :param top: number of functions or allocation sites listed
+        :param nframes: frames kept per traced allocation, deep enough to reach the caller in lib/
+        """
+        if mode not in (None, 'cpu', 'mem'):
+            raise ValueError(f"Unknown profile mode {mode}")
+        self.mode = mode
+        self._path = path
+        self._every = max(1, round(1 / sample)) if sample > 0 else 0
+        self._top = top
+        self._nframes = nframes
+        self._seen = 0
+        self._local = threading.local()
+        self._profiles = []
+        self._start = None
+
+    def sampled(self):
+        """
+        :return: context manager profiling the enclosed row if it is sampled, a no-op otherwise
+        """
+        if self.mode != 'cpu' or not self._every or PROCESS_WIDE_CPU:
+            return nullcontext()
+        with self._lock:
+            self._seen += 1
+            if self._seen % self._every:
+                return nullcontext()
+        return self.__profile_row()
+
+    @contextmanager
+    def __profile_row(self):
+        if (profile := getattr(self._local, 'profile', None)) is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    @contextmanager
+    def loop(self):
+        """
+        wraps the main loop, the reports are written when it ends
+        """
+        if self.mode == 'mem':
+            tracemalloc.start(self._nframes)
+            self._start = tracemalloc.take_snapshot()
+        elif self.mode == 'cpu' and PROCESS_WIDE_CPU:
+            self._profiles.append(profile := cProfile.Profile())
+            profile.enable()
+        try:
+            yield self
+        finally:
+            if self.mode == 'cpu' and PROCESS_WIDE_CPU:
+                self._profiles[0].disable()
+            if self.mode == 'mem':
+                self.__report_mem()
+            elif self.mode == 'cpu':
+                self.__report_cpu()
+
+    def __report_cpu(self):
+        if not self._profiles:
+            logger.warning("No row has been profiled.")
+            return
+        stats = pstats.Stats(*self._profiles)
+        stats.dump_stats(self._path + '.pstats')
+        per_stage = {}
+        for (filename, _, name), (_, _, tottime, _, _) in stats.stats.items():
+            stage = stage_of([f"{filename}:{name}"])
+            per_stage[stage] = per_stage.get(stage, 0.) + tottime
+        text = io.StringIO()
+        if PROCESS_WIDE_CPU:
+            text.write("the whole loop profiled in all the threads\n")
+        else:
+            text.write(f"{self._seen // self._every} rows profiled in {len(self._profiles)} threads\n")
+        text.write("seconds per stage (own time of the functions):\n")
+        for stage, seconds in sorted(per_stage.items(), key=lambda s_: -s_[1]):
+            text.write(f"    {stage:<24s} {seconds:10.3f}\n")
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(self._top)
+        stats.sort_stats('tottime').print_stats(self._top)
+        self.__write(text.getvalue())
+        logger.info(f"CPU profile: {self._path}.pstats, {self._path}.txt")
+
+    def __report_mem(self):
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        per_stage = {}
+        for diff in snapshot.compare_to(self._start, 'traceback'):
+            if diff.size_diff <= 0:
+                continue
+            # frames of a traceback are ordered from the oldest call, the innermost is the last
+            frames = [f_.filename for f_ in reversed(diff.traceback)]
+            sites = per_stage.setdefault(stage_of(frames), {})
+            site = diff.traceback[-1]
+            sites[(site.filename, site.lineno)] = sites.get((site.filename, site.lineno), 0) + diff.size_diff
+        text = io.StringIO()
+        text.write(f"peak traced memory: {peak / 1024 ** 2:.1f} MB\n")
+        for stage, sites in sorted(per_stage.items(), key=lambda s_: -sum(s_[1].values())):
+            text.write(f"{stage}: {sum(sites.values()) / 1024:.1f} KB allocated and still alive\n")
+            for (filename, lineno), size in sorted(sites.items(), key=lambda s_: -s_[1])[:self._top]:
+                text.write(f"    {size / 1024:10.1f} KB  {filename}:{lineno}\n")
+        self.__write(text.getvalue())
+        logger.info(f"Memory profile: {self._path}.txt, peak {peak / 1024 ** 2:.1f} MB")
+
+    def __write(self, text):
+        with open(self._path + '.txt', 'w', encoding='utf-8') as f_:
+            f_.write(text)
+
+
+PROFILER = Profiler()
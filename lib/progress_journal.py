@@ -0,0 +1,72 @@
+import os
+import threading
+from lib.lazy import lazy_logger
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+
+
+class ProgressJournal:
+    """
+    append-only tab separated journal of the checked (talent_id, job_id) pairs and their outcomes,
+    lines are buffered and written with a fsync every batch_size records
+    """
+    def __init__(self, path, batch_size=1000, resume=False):
+        """
+        :param resume: load the pairs recorded by the previous runs and append to the journal,
+                       otherwise the journal is started over
+        """
+        self._path = path
+        self._batch_size = batch_size
+        # pairs recorded by the previous runs, fixed during the run: a pair repeated in the input is checked again
+        self._done = frozenset()
+        self._buffer = []
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            self.__load()
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self._file.tell() and not self.__ends_with_newline():
+            self._file.write('\n')
+
+    def __ends_with_newline(self):
+        with open(self._path, 'rb') as f_:
+            f_.seek(-1, os.SEEK_END)
+            return f_.read(1) == b'\n'
+
+    def __load(self):
+        done = set()
+        with open(self._path, encoding='utf-8') as f_:
+            for line in f_:
+                # the last line can be torn by a crash
+                if not line.endswith('\n') or len(fields := line.rstrip('\n').split('\t')) != 3:
+                    continue
+                done.add((fields[0], fields[1]))
+        self._done = frozenset(done)
+        logger.info(f"Resuming from {self._path}: {len(self._done)} pairs already checked.")
+
+    def done(self, talent_id, job_id):
+        """
+        :return: whether a previous run has recorded the pair
+        """
+        return (str(talent_id), str(job_id)) in self._done
+
+    def record(self, talent_id, job_id, outcome):
+        with self._lock:
+            self._buffer.append(f"{talent_id}\t{job_id}\t{outcome}\n")
+            if len(self._buffer) >= self._batch_size:
+                self.__flush()
+
+    def flush(self):
+        with self._lock:
+            self.__flush()
+
+    def __flush(self):
+        if not self._buffer:
+            return
+        self._file.write(''.join(self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer.clear()
+
+    def close(self):
+        with self._lock:
+            self.__flush()
+            self._file.close()
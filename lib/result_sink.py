@@ -0,0 +1,128 @@
+import os
+import csv
+import threading
+# stages of lib.metrics with a column of their own, the seconds of the others are summed in seconds_other
+STAGES = ('row', 'job', 'es.get_doc', 'es.count', 'es.search', 'conditions.build', 'local.evaluate',
+          'apn.job', 'apn.talent', 'filler.job', 'filler.talent', 'filler.refresh_wait')
+STAGE_COLUMNS = tuple(f"seconds_{s_.replace('.', '_')}" for s_ in STAGES) + ('seconds_other',)
+COLUMNS = ('i', 'talent_id', 'job_id', 'talent_duty', 'job_duty', 'passed', 'failed_conditions') + STAGE_COLUMNS
+
+
+class ResultSink:
+    """
+    one record of COLUMNS per checked pair, buffered by columns and written every buffer_rows records:
+    a row group of a Parquet file, or rows of a CSV file
+    failed_conditions are the names of the unsatisfied conditions in CONDITION_NAMES joined by ',', the seconds of the stages are
+    those of the row, or of its job with --group_by_job
+    """
+    FORMATS = ('parquet', 'csv')
+
+    def __init__(self, path, fmt=None, buffer_rows=10000, resume=False):
+        """
+        :param fmt: 'parquet' or 'csv', None to tell by the extension of path
+        :param resume: append to the CSV file of the previous runs, otherwise it is started over;
+                       a Parquet file is always written anew
+        """
+        self._path = path
+        if (fmt := fmt or os.path.splitext(path)[1].lstrip('.').lower()) not in self.FORMATS:
+            raise ValueError(f"Unknown result format {fmt}, expected one of {self.FORMATS}")
+        self._format = fmt
+        self._buffer_rows = buffer_rows
+        self._columns = {c_: [] for c_ in COLUMNS}
+        self._lock = threading.Lock()
+        self._writer = None
+        self._file = None
+        self.rows = 0
+        if fmt == 'csv':
+            new = not resume or not os.path.exists(path) or not os.path.getsize(path)
+            self._file = open(path, 'a' if resume else 'w', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            if new:
+                self._writer.writerow(COLUMNS)
+
+    def append(self, i, row, failed_conditions, stages=None):
+        """
+        :param failed_conditions: names of the unsatisfied conditions, e.g. ['skill', 'language'], empty if passed
+        :param stages: {stage: seconds}, see Metrics.track
+        """
+        stages = stages or {}
+        other = sum(v_ for k_, v_ in stages.items() if k_ not in STAGES)
+        with self._lock:
+            for column, value in zip(COLUMNS, (i, int(row.talent_id), int(row.job_id), str(row.talent_duty),
+                                               str(row.job_duty), not failed_conditions, ','.join(failed_conditions))):
+                self._columns[column].append(value)
+            for stage, column in zip(STAGES, STAGE_COLUMNS):
+                self._columns[column].append(stages.get(stage, 0.))
+            self._columns['seconds_other'].append(other)
+            self.rows += 1
+            if len(self._columns['i']) >= self._buffer_rows:
+                self.__flush()
+
+    def __flush(self):
+        if not self._columns['i']:
+            return
+        if self._format == 'parquet':
+            self.__write_parquet()
+        else:
+            self.__write_csv()
+        for values in self._columns.values():
+            values.clear()
+
+    def __write_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pydict(self._columns, schema=schema())
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._path, table.schema)
+        self._writer.write_table(table)
+
+    def __write_csv(self):
+        self._writer.writerows(zip(*(self._columns[c_] for c_ in COLUMNS)))
+        self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self.__flush()
+            if self._format == 'parquet' and self._writer is not None:
+                self._writer.close()
+            if self._file is not None:
+                self._file.close()
+
+
+def schema():
+    import pyarrow as pa
+    return pa.schema([('i', pa.int64()), ('talent_id', pa.int64()), ('job_id', pa.int64()),
+                      ('talent_duty', pa.string()), ('job_duty', pa.string()), ('passed', pa.bool_()),
+                      ('failed_conditions', pa.string())] + [(c_, pa.float64()) for c_ in STAGE_COLUMNS])
+
+
+def read_results(path):
+    """
+    :return: DataFrame of the records written by ResultSink
+    """
+    import pandas as pd
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype={'talent_duty': str, 'job_duty': str, 'failed_conditions': str},
+                       keep_default_na=False)
+
+
+def failure_summary(results):
+    """
+    :param results: DataFrame of the records, or the path of a ResultSink file
+    :return: DataFrame per failed condition name: the failed pairs, their rate among all the pairs
+             and their share of the failed pairs; sorted by failures
+    """
+    import pandas as pd
+    if isinstance(results, str):
+        results = read_results(results)
+    failed = results[~results.passed.astype(bool)]
+    types = failed.failed_conditions.str.split(',').explode()
+    # a pair failing several sub-conditions of the same condition counts once for it
+    types = types[types != ''].reset_index().drop_duplicates()
+    types.columns = ['index', 'condition']
+    per_type = types.groupby('condition')['index']
+    summary = pd.DataFrame({'failed': per_type.size()})
+    summary['failure_rate'] = summary.failed / len(results) if len(results) else float('nan')
+    summary['share_of_failed'] = summary.failed / len(failed) if len(failed) else float('nan')
+    return summary.sort_values('failed', ascending=False)
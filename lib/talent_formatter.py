@@ -1,17 +1,58 @@
+import os
 import csv
 import codecs
-from libsearcher.pylibshared.utils.logger import get_logger
+import pickle
+from functools import lru_cache
+from lib.lazy import lazy_logger
 
-logger = get_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+logger = lazy_logger(__name__, debug_level='DEBUG', to_file=True, to_stdout=True)
+INDUSTRY_MAPPING_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'meta_data', 'Linkedin-HiTalent Industry Mapping.csv')
+INDUSTRY_MAPPING_PICKLE = INDUSTRY_MAPPING_CSV + '.pickle'
 
-INDUSTRY_MAPPING = {}
-with codecs.open("meta_data/Linkedin-HiTalent Industry Mapping.csv", 'rU', 'utf-8-sig') as csv_file:
-    for row_ in csv.reader(csv_file, delimiter=r',', quotechar=r'"', quoting=csv.QUOTE_MINIMAL):
-        INDUSTRY_MAPPING[row_[0].lower()] = set()
-        for ind_ in row_[1].split('|'):
-            words = ind_.split('.')
-            for i in range(len(words)):
-                INDUSTRY_MAPPING[row_[0].lower()].add('.'.join(words[:i + 1]))
+
+def load_industry_mapping(csv_path=INDUSTRY_MAPPING_CSV):
+    industry_mapping = {}
+    with codecs.open(csv_path, 'r', 'utf-8-sig') as csv_file:
+        for row_ in csv.reader(csv_file, delimiter=r',', quotechar=r'"', quoting=csv.QUOTE_MINIMAL):
+            industry_mapping[row_[0].lower()] = set()
+            for ind_ in row_[1].split('|'):
+                words = ind_.split('.')
+                for i in range(len(words)):
+                    industry_mapping[row_[0].lower()].add('.'.join(words[:i + 1]))
+    return industry_mapping
+
+
+@lru_cache(maxsize=None)
+def get_industry_mapping():
+    """
+    loaded on first use, the parsed mapping is pickled next to the csv and reused until the csv changes
+    """
+    stat_ = os.stat(INDUSTRY_MAPPING_CSV)
+    version = (stat_.st_mtime_ns, stat_.st_size)
+    try:
+        with open(INDUSTRY_MAPPING_PICKLE, 'rb') as f_:
+            cached_version, industry_mapping = pickle.load(f_)
+        if cached_version == version:
+            return industry_mapping
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    industry_mapping = load_industry_mapping()
+    try:
+        tmp_ = f"{INDUSTRY_MAPPING_PICKLE}.{os.getpid()}"
+        with open(tmp_, 'wb') as f_:
+            pickle.dump((version, industry_mapping), f_, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_, INDUSTRY_MAPPING_PICKLE)
+    except OSError as e:
+        logger.warning(f"Cannot cache the industry mapping: {e}")
+    return industry_mapping
+
+
+def __getattr__(name):
+    # INDUSTRY_MAPPING used to be built at import time
+    if name == 'INDUSTRY_MAPPING':
+        return get_industry_mapping()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def talent_v1_to_v2(doc):
@@ -24,8 +65,9 @@ def talent_v1_to_v2(doc):
                     raise ValueError(f"Inconsistent LinkedIn {website} -- {contact.get('details', None)}")
     # industries
     industries = set()
+    industry_mapping = get_industry_mapping()
     for key in doc.get('industries', []):
-        industries |= INDUSTRY_MAPPING[key.lower()]
+        industries |= industry_mapping[key.lower()]
     if industries:
         doc['industries'] = list(industries)
     # useless keys
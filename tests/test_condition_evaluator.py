@@ -0,0 +1,131 @@
+"""
+the in process evaluation of the ES query DSL against talent docs, see lib.condition_evaluator
+python3 -m pytest tests
+"""
+from datetime import datetime, timedelta
+import pytest
+from lib.condition_evaluator import ConditionEvaluator, Scope, UnsupportedQuery, flatten_mapping, opaque_fields, \
+    minimum_should_match
+PROPERTIES = {
+    'title': {'type': 'text', 'fields': {'keyword': {'type': 'keyword'},
+                                         'raw': {'type': 'keyword', 'normalizer': 'lowercase'}},
+              'copy_to': 'all_text'},
+    'all_text': {'type': 'text'},
+    'summary': {'type': 'text', 'analyzer': 'ik_smart'},
+    'skills': {'type': 'keyword'},
+    'experienceYears': {'type': 'integer'},
+    'birthDate': {'type': 'date'},
+    'educations': {'type': 'nested', 'properties': {'degree': {'type': 'keyword'}, 'major': {'type': 'keyword'}}},
+}
+SOURCE = {
+    'title': 'Senior Java Developer',
+    'skills': ['JAVA', 'SPRING'],
+    'experienceYears': 7,
+    'birthDate': (datetime.now() - timedelta(days=30 * 365)).strftime('%Y-%m-%d'),
+    'educations': [{'degree': 'BACHELOR', 'major': 'physics'}, {'degree': 'MASTER', 'major': 'computer'}],
+}
+
+
+@pytest.fixture
+def evaluator():
+    return ConditionEvaluator(flatten_mapping(PROPERTIES), opaque_fields(PROPERTIES))
+
+
+def matches(evaluator, query, source=SOURCE):
+    return evaluator.matches(query, Scope(source, 1))
+
+
+def term(field, value):
+    return {'term': {field: value}}
+
+
+def test_bool_should_filters_only_without_must(evaluator):
+    hit, miss = term('skills', 'JAVA'), term('skills', 'PYTHON')
+    assert matches(evaluator, {'bool': {'should': [hit, miss]}})
+    assert not matches(evaluator, {'bool': {'should': [miss]}})
+    # with a must clause the should clauses only score
+    assert matches(evaluator, {'bool': {'must': [hit], 'should': [miss]}})
+    assert not matches(evaluator, {'bool': {'filter': [hit], 'should': [miss], 'minimum_should_match': 1}})
+    assert not matches(evaluator, {'bool': {'must': [hit], 'must_not': [term('skills', 'SPRING')]}})
+    assert matches(evaluator, {'bool': {}})
+
+
+def test_minimum_should_match():
+    assert minimum_should_match(2, 4) == 2
+    assert minimum_should_match(-1, 4) == 3
+    assert minimum_should_match('75%', 4) == 3
+    assert minimum_should_match('-25%', 4) == 3
+    with pytest.raises(UnsupportedQuery):
+        minimum_should_match('3<90%', 4)
+
+
+def test_term_text_and_keyword(evaluator):
+    # a text field is matched by its lowercase tokens
+    assert matches(evaluator, term('title', 'java'))
+    assert not matches(evaluator, term('title', 'Java'))
+    # a keyword field, or the keyword sub-field of a text one, by the exact value
+    assert matches(evaluator, term('title.keyword', 'Senior Java Developer'))
+    assert not matches(evaluator, term('title.keyword', 'java'))
+    assert matches(evaluator, {'terms': {'skills': ['PYTHON', 'SPRING']}})
+    assert not matches(evaluator, term('skills', 'java'))
+    assert matches(evaluator, term('experienceYears', '7'))
+
+
+def test_term_without_mapping():
+    # the exact value or one of its tokens
+    evaluator = ConditionEvaluator()
+    assert matches(evaluator, term('title', 'Senior Java Developer'))
+    assert matches(evaluator, term('title', 'java'))
+    assert matches(evaluator, term('title.keyword', 'Senior Java Developer'))
+    assert not matches(evaluator, term('missing.raw', 'java'))
+    # a sub-field of a value other than the keyword one is not in the _source
+    with pytest.raises(UnsupportedQuery):
+        matches(evaluator, term('title.raw', 'senior java developer'))
+
+
+def test_match(evaluator):
+    assert matches(evaluator, {'match': {'title': 'python developer'}})
+    assert not matches(evaluator, {'match': {'title': {'query': 'python developer', 'operator': 'and'}}})
+    assert matches(evaluator, {'match': {'title': {'query': 'java python developer', 'minimum_should_match': 2}}})
+    assert matches(evaluator, {'match_phrase': {'title': 'java developer'}})
+    assert not matches(evaluator, {'match_phrase': {'title': 'developer java'}})
+
+
+def test_nested_matches_within_one_object(evaluator):
+    both = {'bool': {'must': [term('educations.degree', 'MASTER'), term('educations.major', 'computer')]}}
+    assert matches(evaluator, {'nested': {'path': 'educations', 'query': both}})
+    crossed = {'bool': {'must': [term('educations.degree', 'MASTER'), term('educations.major', 'physics')]}}
+    assert not matches(evaluator, {'nested': {'path': 'educations', 'query': crossed}})
+
+
+def test_range(evaluator):
+    assert matches(evaluator, {'range': {'experienceYears': {'gte': 5, 'lt': 10}}})
+    assert not matches(evaluator, {'range': {'experienceYears': {'gt': 7}}})
+    # date math: born between 35 and 25 years ago
+    assert matches(evaluator, {'range': {'birthDate': {'gte': 'now-35y', 'lte': 'now-25y'}}})
+    assert not matches(evaluator, {'range': {'birthDate': {'gte': 'now-25y/d'}}})
+    with pytest.raises(UnsupportedQuery):
+        matches(evaluator, {'range': {'birthDate': {'gte': '01/01/1990', 'format': 'dd/MM/yyyy'}}})
+
+
+def test_exists_and_ids(evaluator):
+    assert matches(evaluator, {'exists': {'field': 'educations'}})
+    assert not matches(evaluator, {'exists': {'field': 'languages'}})
+    assert matches(evaluator, {'ids': {'values': [1, 2]}})
+    assert not matches(evaluator, {'ids': {'values': ['2']}})
+
+
+def test_opaque_fields_are_left_to_es(evaluator):
+    assert opaque_fields(PROPERTIES) == {'all_text', 'summary', 'title.raw'}
+    for query in (term('all_text', 'java'), {'match': {'summary': 'java'}}, term('title.raw', 'senior java developer'),
+                  {'exists': {'field': 'all_text'}}):
+        with pytest.raises(UnsupportedQuery):
+            matches(evaluator, query)
+
+
+def test_unsupported_queries(evaluator):
+    for query in ({'wildcard': {'title': 'jav*'}}, {'term': {'title': {'value': 'JAVA', 'case_insensitive': True}}},
+                  {'match': {'title': {'query': 'jva', 'fuzziness': 'AUTO'}}}, {'term': {'a': 1, 'b': 2}},
+                  {'term': {'skills': 'JAVA'}, 'match_all': {}}):
+        with pytest.raises(UnsupportedQuery):
+            matches(evaluator, query)
@@ -0,0 +1,82 @@
+"""
+the journal of a harvest interrupted then resumed with --resume: every pair is checked exactly once
+python3 -m pytest tests
+"""
+import pytest
+pytest.importorskip('pandas')
+pytest.importorskip('libsearcher')
+import data_harvester
+PAIRS = [(t_, t_ % 4) for t_ in range(1, 21)] + [(3, 3)]  # (3, 3) is a pair repeated in the input
+
+
+class Interrupted(Exception):
+    pass
+
+
+def write_data(path):
+    header = ['talent_id', 'job_id', 'interviewed'] + [f'c{k_}' for k_ in range(3, 8)] + ['job_duty', 'talent_duty']
+    lines = [','.join(header)] + [','.join([str(t_), str(j_), 'true'] + [''] * 5 + ['Amos', 'Amos'])
+                                  for t_, j_ in PAIRS]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def run(monkeypatch, argv, stop_after=None):
+    """
+    :param stop_after: number of rows checked before the run is interrupted, None to run to the end
+    :return: the checked (talent_id, job_id) pairs
+    """
+    checked = []
+
+    def check_items(items, clients, args, skip=None, features=False, timings=False):
+        for i, row in enumerate(items, 1):
+            if skip and skip(row):
+                continue
+            if len(checked) == stop_after:
+                raise Interrupted()
+            checked.append((row.talent_id, row.job_id))
+            yield i, row, None
+
+    monkeypatch.setattr(data_harvester, 'create_clients', lambda args: None)
+    monkeypatch.setattr(data_harvester, 'check_items', check_items)
+    monkeypatch.setattr(data_harvester, 'args', data_harvester.parse_args(argv), raising=False)
+    if stop_after is None:
+        data_harvester.main()
+    else:
+        with pytest.raises(Interrupted):
+            data_harvester.main()
+    return checked
+
+
+def test_resume_checks_every_pair_once(tmp_path, monkeypatch):
+    data, journal = tmp_path / 'data.csv', tmp_path / 'harvest.journal'
+    write_data(data)
+    argv = ['-d', str(data), '-j', str(journal), '--journal_batch', '7']
+    first = run(monkeypatch, argv, stop_after=9)
+    assert first == PAIRS[:9]
+    assert len(journal.read_text(encoding='utf-8').splitlines()) == 9
+    # the repeated pair was checked by the first run
+    second = run(monkeypatch, argv + ['--resume'])
+    assert second == [p_ for p_ in PAIRS[9:] if p_ not in first]
+    # nothing left to check
+    assert run(monkeypatch, argv + ['--resume']) == []
+
+
+def test_fresh_run_records_every_row(tmp_path, monkeypatch):
+    data, journal = tmp_path / 'data.csv', tmp_path / 'harvest.journal'
+    write_data(data)
+    journal.write_text('1\t1\tpassed\n', encoding='utf-8')
+    # without --resume the previous journal is started over and the repeated pair is checked twice
+    assert run(monkeypatch, ['-d', str(data), '-j', str(journal), '--journal_batch', '7']) == PAIRS
+    assert len(journal.read_text(encoding='utf-8').splitlines()) == len(PAIRS)
+
+
+def test_resume_rejects_parquet_output(tmp_path):
+    # the records of the previous runs would be lost: a Parquet file is written anew
+    with pytest.raises(SystemExit):
+        data_harvester.parse_args(['-j', str(tmp_path / 'harvest.journal'), '-o', str(tmp_path / 'out.parquet'),
+                                   '--resume'])
+
+
+def test_resume_requires_journal(tmp_path):
+    with pytest.raises(SystemExit):
+        data_harvester.parse_args(['-o', str(tmp_path / 'out.csv'), '--resume'])